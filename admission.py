@@ -0,0 +1,78 @@
+import functools
+import math
+import os
+import threading
+
+from flask import jsonify, request
+
+import metrics
+from rate_limit import TokenBucket
+from ttl_cache import TTLCache
+
+# Requests per second (sustained, burst) admitted to the guarded public routes, across all gigs in this worker
+ADMISSION_GLOBAL_RATE = float(os.getenv("ADMISSION_GLOBAL_RATE", "50"))
+ADMISSION_GLOBAL_BURST = float(os.getenv("ADMISSION_GLOBAL_BURST", "100"))
+# ...and per gig (or DJ connect account when the request has no gig_id), so one packed room can't starve the rest
+ADMISSION_GIG_RATE = float(os.getenv("ADMISSION_GIG_RATE", "10"))
+ADMISSION_GIG_BURST = float(os.getenv("ADMISSION_GIG_BURST", "30"))
+# Idle per-gig buckets are dropped after this long (a fresh bucket starts full, so that's harmless)
+ADMISSION_BUCKET_TTL_SECONDS = 600
+ADMISSION_MAX_BUCKETS = 4096
+# Set to 0 to turn admission control off
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") != "0"
+
+_global_bucket = TokenBucket(ADMISSION_GLOBAL_RATE, ADMISSION_GLOBAL_BURST)
+_gig_buckets = TTLCache(maxsize=ADMISSION_MAX_BUCKETS, ttl=ADMISSION_BUCKET_TTL_SECONDS)
+_gig_buckets_lock = threading.Lock()
+
+
+def _gig_bucket(key):
+    with _gig_buckets_lock:
+        bucket = _gig_buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(ADMISSION_GIG_RATE, ADMISSION_GIG_BURST)
+        # Re-set on every use so busy gigs never expire mid-burst
+        _gig_buckets.set(key, bucket)
+        return bucket
+
+
+def admit(key=None):
+    """
+    Takes a token from the gig's bucket (when `key` is given) and the global
+    one. Returns None if admitted, else (scope, seconds until a retry can succeed).
+    """
+    if key:
+        wait = _gig_bucket(key).try_acquire()
+        if wait:
+            return 'gig', wait
+    wait = _global_bucket.try_acquire()
+    if wait:
+        return 'global', wait
+    return None
+
+
+def _request_key():
+    data = request.get_json(silent=True) or {}
+    key = ((request.view_args or {}).get('gig_id') or data.get('gig_id') or data.get('connect_id')
+           or data.get('dj_connect_id'))
+    return str(key) if key else None
+
+
+def admission_controlled(view):
+    """
+    Sheds load before the view runs: over-budget requests get an immediate
+    429 with Retry-After instead of queueing up behind Airtable and Stripe.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if ADMISSION_ENABLED:
+            rejected = admit(_request_key())
+            if rejected:
+                scope, wait = rejected
+                metrics.admission_rejections.inc(route=request.endpoint, scope=scope)
+                response = jsonify({'error': 'Too many requests, please retry shortly', 'scope': scope})
+                response.status_code = 429
+                response.headers['Retry-After'] = str(max(1, math.ceil(wait)))
+                return response
+        return view(*args, **kwargs)
+    return wrapper
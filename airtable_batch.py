@@ -0,0 +1,167 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+import requests
+
+from airtable_client import airtable
+from structured_logging import SAMPLED
+
+# Airtable accepts at most 10 records per create/update call
+AIRTABLE_BATCH_SIZE = 10
+AIRTABLE_BATCH_MAX_DELAY = float(os.getenv("AIRTABLE_BATCH_MAX_DELAY_MS", "200")) / 1000
+
+
+class _PendingWrite:
+    __slots__ = ('record_id', 'fields', 'future', 'queued_at')
+
+    def __init__(self, record_id, fields):
+        self.record_id = record_id
+        self.fields = fields
+        self.future = Future()
+        self.queued_at = time.monotonic()
+
+    def payload(self):
+        if self.record_id:
+            return {'id': self.record_id, 'fields': self.fields}
+        return {'fields': self.fields}
+
+
+class AirtableBatchWriter:
+    """
+    Groups Airtable creates and updates into 10-record calls per table.
+
+    Every write returns a Future resolving to its Airtable record (or raising
+    that record's error). A write to an idle queue goes out right away; while
+    a call for that table and method is in flight, later writes collect and
+    are sent together once it returns, it fills a batch, or the oldest has
+    waited `max_delay` seconds. When Airtable rejects a batch for a
+    record-level reason, the batch is replayed one record at a time so only
+    the offending record fails.
+    """
+
+    def __init__(self, client=airtable, batch_size=AIRTABLE_BATCH_SIZE, max_delay=AIRTABLE_BATCH_MAX_DELAY):
+        self.client = client
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self._queues = {}  # (table, method, merge_on) -> [_PendingWrite]
+        self._in_flight = {}  # (table, method, merge_on) -> batches being sent
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def create(self, table, fields):
+        return self._enqueue(table, 'POST', _PendingWrite(None, fields))
+
+    def update(self, table, record_id, fields):
+        return self._enqueue(table, 'PATCH', _PendingWrite(record_id, fields))
+
+    def upsert(self, table, fields, merge_on):
+        """
+        Creates the record, or updates the one whose `merge_on` fields match.
+        Sent as a PATCH with performUpsert, so resending it never duplicates.
+        """
+        return self._enqueue(table, 'PATCH', _PendingWrite(None, fields), tuple(merge_on))
+
+    def flush(self):
+        """Sends everything queued so far from the calling thread."""
+        with self._cond:
+            batches = self._take_batches(force=True)
+        self._send_batches(batches)
+
+    def _enqueue(self, table, method, item, merge_on=None):
+        with self._cond:
+            queue = self._queues.setdefault((table, method, merge_on), [])
+            queue.append(item)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="airtable-batch-writer", daemon=True)
+                self._thread.start()
+            if len(queue) >= self.batch_size or len(queue) == 1:
+                self._cond.notify_all()
+        return item.future
+
+    def _take_batches(self, force=False):
+        # Caller must hold self._cond
+        now = time.monotonic()
+        batches = []
+        for key, queue in self._queues.items():
+            # Nothing in flight for this queue: no reason to hold the write back
+            idle = not self._in_flight.get(key)
+            while queue and (force or idle or len(queue) >= self.batch_size
+                             or now - queue[0].queued_at >= self.max_delay):
+                batches.append((key, queue[:self.batch_size]))
+                del queue[:self.batch_size]
+                self._in_flight[key] = self._in_flight.get(key, 0) + 1
+        return batches
+
+    def _next_deadline(self):
+        # Caller must hold self._cond; idle queues were already taken, so only held-back writes remain
+        oldest = [queue[0].queued_at for queue in self._queues.values() if queue]
+        if not oldest:
+            return None
+        return max(0.0, min(oldest) + self.max_delay - time.monotonic())
+
+    def _run(self):
+        while True:
+            with self._cond:
+                batches = self._take_batches()
+                if not batches:
+                    self._cond.wait(timeout=self._next_deadline())
+                    continue
+            self._send_batches(batches)
+
+    def _send_batches(self, batches):
+        for key, items in batches:
+            try:
+                self._send(key, items)
+            except Exception as e:
+                logging.error(f"Airtable batch writer crashed on {key}: {e}")
+                for item in items:
+                    if not item.future.done():
+                        item.future.set_exception(e)
+            finally:
+                with self._cond:
+                    self._in_flight[key] -= 1
+                    # Writes held back behind this call can go now
+                    self._cond.notify_all()
+
+    def _send(self, key, items):
+        table, method, merge_on = key
+        body = {'records': [item.payload() for item in items]}
+        if merge_on:
+            body['performUpsert'] = {'fieldsToMergeOn': list(merge_on)}
+        try:
+            response = self.client.request(method, table, json=body)
+            records = response.json().get('records', [])
+        except requests.exceptions.HTTPError as e:
+            if len(items) > 1 and _is_record_level_error(e.response):
+                # Replay one by one so the error lands on the record that caused it
+                for item in items:
+                    self._send(key, [item])
+                return
+            self._fail(table, method, items, e)
+            return
+        except Exception as e:
+            self._fail(table, method, items, e)
+            return
+
+        for item, record in zip(items, records):
+            item.future.set_result(record)
+        for item in items[len(records):]:
+            self._fail(table, method, [item], RuntimeError("Airtable response did not include this record."))
+        logging.info(f"Airtable batch {method} on {table}: {len(records)} record(s).", extra=SAMPLED)
+
+    def _fail(self, table, method, items, error):
+        for item in items:
+            target = item.record_id or "new record"
+            logging.error(f"Airtable {method} on {table} failed for {target}: {error}")
+            item.future.set_exception(error)
+
+
+def _is_record_level_error(response):
+    # 422/404 point at bad record data or ids; auth and rate-limit errors apply to the whole batch
+    return response is not None and response.status_code in (404, 422)
+
+
+batch_writer = AirtableBatchWriter()
@@ -0,0 +1,173 @@
+import logging
+import os
+import random
+import re
+import time
+from datetime import datetime, timezone
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+from rate_limit import TokenBucket
+
+AIRTABLE_API_KEY = os.getenv("AIRTABLE_API_KEY")
+AIRTABLE_BASE_ID = os.getenv("AIRTABLE_BASE_ID")
+AIRTABLE_API_ROOT = os.getenv("AIRTABLE_API_ROOT", "https://api.airtable.com/v0")
+
+# Airtable allows 5 requests per second per base
+AIRTABLE_RATE_LIMIT = float(os.getenv("AIRTABLE_RATE_LIMIT", "5"))
+AIRTABLE_MAX_RETRIES = int(os.getenv("AIRTABLE_MAX_RETRIES", "4"))
+AIRTABLE_BACKOFF_BASE = float(os.getenv("AIRTABLE_BACKOFF_BASE_SECONDS", "1"))
+AIRTABLE_BACKOFF_CAP = float(os.getenv("AIRTABLE_BACKOFF_CAP_SECONDS", "30"))
+AIRTABLE_TIMEOUT = float(os.getenv("AIRTABLE_TIMEOUT_SECONDS", "30"))
+AIRTABLE_POOL_SIZE = int(os.getenv("AIRTABLE_POOL_SIZE", "10"))
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Incremental syncs look back this far past the last one to cover clock skew between us and Airtable
+AIRTABLE_CURSOR_OVERLAP_SECONDS = 120
+
+# song_requests_tbl rows the notify pipeline hasn't finished (notified unchecked or empty)
+UNNOTIFIED_FORMULA = 'OR({notified} = 0, NOT({notified}))'
+
+
+def formula_string(value):
+    """Quotes a value as a string literal for filterByFormula (Stripe search queries escape the same way)."""
+    escaped = str(value).replace("\\", "\\\\").replace("'", "\\'")
+    return f"'{escaped}'"
+
+
+def utc_iso(timestamp):
+    """Formats a Unix timestamp the way Airtable formulas compare times (IS_AFTER cursors)."""
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+
+class AirtableClient:
+    """
+    Process-wide Airtable client: one keep-alive connection pool, a token
+    bucket held to the per-base rate limit, and jittered retries on 429/5xx.
+
+    Requests raise `requests.HTTPError` for any final non-2xx response, so
+    callers no longer need their own `raise_for_status()`.
+    """
+
+    def __init__(self, api_key=AIRTABLE_API_KEY, base_id=AIRTABLE_BASE_ID, api_root=AIRTABLE_API_ROOT,
+                 rate_limit=AIRTABLE_RATE_LIMIT, max_retries=AIRTABLE_MAX_RETRIES, timeout=AIRTABLE_TIMEOUT):
+        self.base_id = base_id
+        self.api_root = api_root.rstrip('/')
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.limiter = TokenBucket(rate_limit)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=AIRTABLE_POOL_SIZE)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Authorization': f'Bearer {api_key}',
+            'Content-Type': 'application/json'
+        })
+
+    def table_url(self, table, record_id=None):
+        url = f'{self.api_root}/{self.base_id}/{table}'
+        return f'{url}/{record_id}' if record_id else url
+
+    def request(self, method, table, record_id=None, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        url = self.table_url(table, record_id)
+        # A POST that reached Airtable may have created records, so only 429s (never processed) retry it
+        retry_server_errors = method.upper() != 'POST'
+
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            response = None
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self._record(method, table, started, 'error')
+                if not retry_server_errors or attempt >= self.max_retries:
+                    raise
+                logging.warning(f"Airtable {method} {table} network error, retrying: {e}")
+            else:
+                status = response.status_code
+                retryable = status == 429 or (retry_server_errors and status in RETRYABLE_STATUS_CODES)
+                self._record(method, table, started, status)
+                if not retryable or attempt >= self.max_retries:
+                    response.raise_for_status()
+                    return response
+                logging.warning(f"Airtable {method} {table} returned {status}, retrying.")
+
+            time.sleep(self._backoff(attempt, response))
+            attempt += 1
+            metrics.outbound_retries.inc(service='airtable', operation=f'{method.upper()} {table}')
+
+    def get(self, table, record_id=None, **kwargs):
+        return self.request('GET', table, record_id, **kwargs)
+
+    def post(self, table, **kwargs):
+        return self.request('POST', table, **kwargs)
+
+    def patch(self, table, record_id=None, **kwargs):
+        return self.request('PATCH', table, record_id, **kwargs)
+
+    def iter_pages(self, table, params=None):
+        """
+        Lazily follows Airtable's `offset` through a list request, yielding
+        each non-empty page of API records as it arrives. `params` is copied,
+        never modified.
+        """
+        params = dict(params or {})
+        while True:
+            body = self.get(table, params=params).json()
+            if body.get('records'):
+                yield body['records']
+            if not body.get('offset'):
+                return
+            params['offset'] = body['offset']
+
+    def iter_records(self, table, params=None):
+        """Like iter_pages(), one API record at a time."""
+        for page in self.iter_pages(table, params):
+            yield from page
+
+    def _backoff(self, attempt, response=None):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), AIRTABLE_BACKOFF_CAP)
+            except ValueError:
+                pass
+        delay = min(AIRTABLE_BACKOFF_CAP, AIRTABLE_BACKOFF_BASE * (2 ** attempt))
+        return delay * random.uniform(0.5, 1.5)
+
+    def _record(self, method, table, started, status):
+        operation = f'{method.upper()} {table}'
+        metrics.outbound_latency.observe(time.perf_counter() - started, service='airtable', operation=operation)
+        metrics.outbound_requests.inc(service='airtable', operation=operation, status=status)
+
+
+def is_unknown_field_error(e):
+    """
+    True for Airtable's 422 naming a field the table doesn't have (e.g. a
+    column not added yet), whether it was requested or written directly
+    (UNKNOWN_FIELD_NAME) or referenced in filterByFormula.
+    """
+    response = getattr(e, 'response', None)
+    if response is None or response.status_code != 422:
+        return False
+    return 'UNKNOWN_FIELD_NAME' in response.text or (
+        'INVALID_FILTER_BY_FORMULA' in response.text and 'unknown field name' in response.text.lower())
+
+
+def unknown_field_name(e):
+    """The field an UNKNOWN_FIELD_NAME error complains about ('Unknown field name: "x"'), or None."""
+    if not is_unknown_field_error(e):
+        return None
+    match = re.search(r'Unknown field name: \\?"([^"\\]+)', e.response.text)
+    return match.group(1) if match else None
+
+
+airtable = AirtableClient()
@@ -1,97 +1,203 @@
-import requests
 from datetime import datetime, timezone
+import hashlib
+import json
 import logging
 import os
-import clicksend_client
-from clicksend_client import SmsMessage
-from clicksend_client.rest import ApiException
+import time
+from concurrent.futures import ThreadPoolExecutor
+from ttl_cache import TTLCache
+from airtable_batch import batch_writer
+from airtable_client import airtable, formula_string, utc_iso, AIRTABLE_CURSOR_OVERLAP_SECONDS, UNNOTIFIED_FORMULA
+from charge_service import charge_customer
+from sms_dispatcher import sms_dispatcher
+import notify_state
+import notify_outbox
+import metrics
+from request_board import request_board
+from singleflight import SingleFlight
+from structured_logging import SAMPLED
+from process_lock import FileLock
 
-# Airtable setup
-AIRTABLE_API_KEY = os.getenv("AIRTABLE_API_KEY")
-BASE_ID = os.getenv("AIRTABLE_BASE_ID")
+# Airtable setup (credentials and connection pooling live in airtable_client)
 TABLE_NAME = 'song_requests_tbl'
 VIEW_NAME = 'accepted_view'
-CLICKSEND_API_KEY = os.getenv("CLICKSEND_API_KEY")
-CLICKSEND_USERNAME = os.getenv("CLICKSEND_USERNAME")
-CHARGE_CUSTOMER_URL = 'https://stripe-intent-python-script.onrender.com/charge-customer'
+# Upper bound on records processed in parallel per check_and_notify cycle (1 = sequential)
+NOTIFY_MAX_WORKERS = int(os.getenv("NOTIFY_MAX_WORKERS", "4"))
 
-HEADERS = {
-    'Authorization': f'Bearer {AIRTABLE_API_KEY}',
-    'Content-Type': 'application/json'
-}
+# Gig -> stripe_connect_id cache shared by the scheduler and the Flask routes
+GIGS_TABLE_NAME = 'gigs_tbl'
+GIG_CACHE_TTL_SECONDS = int(os.getenv("GIG_CACHE_TTL_SECONDS", "600"))
+GIG_CACHE_NEGATIVE_TTL_SECONDS = int(os.getenv("GIG_CACHE_NEGATIVE_TTL_SECONDS", "60"))
+GIG_CACHE_MAX_ENTRIES = int(os.getenv("GIG_CACHE_MAX_ENTRIES", "1024"))
+GIG_WARM_CHUNK_SIZE = 50  # keeps the OR(...) formula well under URL length limits
+_NO_GIG = False  # cached marker for gig_ids with no matching record
+connect_id_cache = TTLCache(maxsize=GIG_CACHE_MAX_ENTRIES, ttl=GIG_CACHE_TTL_SECONDS)
+# A burst of guests scanning the same gig's QR code shares one Airtable lookup per cache miss
+_connect_id_lookups = SingleFlight('connect_id')
 
-def get_accepted_unnotified_records():
-    url = f'https://api.airtable.com/v0/{BASE_ID}/{TABLE_NAME}'
+# Only the fields the notify pipeline reads are requested from Airtable
+NOTIFY_FIELDS = ('phone_number', 'song_name', 'customer_id', 'payment_method_id',
+                 'bid_amount', 'request_id', 'gig_id')
+ACCEPTED_PAGE_SIZE = 100  # Airtable's maximum pageSize
+# High-water mark for incremental polling, and how often to fall back to a full sweep of the view
+CURSOR_KEY = 'accepted_view_cursor'
+FULL_SWEEP_KEY = 'accepted_view_full_sweep_at'
+NOTIFY_FULL_SWEEP_HOURS = float(os.getenv("NOTIFY_FULL_SWEEP_HOURS", "24"))
+# Serializes pipeline runs across threads and gunicorn workers, so the poll and
+# webhook-triggered runs never charge the same record twice
+_pipeline_lock = FileLock("notify_pipeline")
+
+
+class AcceptedRecord:
+    """Compact view of an accepted song request carrying only NOTIFY_FIELDS."""
+    __slots__ = ('record_id',) + NOTIFY_FIELDS
+
+    def __init__(self, record_id, fields):
+        self.record_id = record_id
+        for name in NOTIFY_FIELDS:
+            setattr(self, name, fields.get(name))
+
+    @classmethod
+    def from_api(cls, record):
+        return cls(record['id'], record.get('fields', {}))
+
+    def is_complete(self):
+        return all(getattr(self, name) for name in NOTIFY_FIELDS)
+
+    def fingerprint(self):
+        # Changes whenever the guest or DJ edits anything the pipeline uses (card, phone, amount, ...)
+        values = json.dumps([getattr(self, name) for name in NOTIFY_FIELDS], default=str)
+        return hashlib.sha256(values.encode()).hexdigest()[:16]
+
+    def __repr__(self):
+        return f"AcceptedRecord({self.record_id!r}, request_id={self.request_id!r})"
+
+
+def iter_accepted_unnotified_pages(page_size=ACCEPTED_PAGE_SIZE, extra_formula=None):
+    """
+    Lazily follows Airtable's `offset` through accepted_view, yielding one
+    list of AcceptedRecord per page so only a single page is held at a time.
+    `extra_formula` further narrows the unnotified filter.
+    """
+    formula = UNNOTIFIED_FORMULA if not extra_formula else f"AND({UNNOTIFIED_FORMULA}, {extra_formula})"
     params = {
         'view': VIEW_NAME,
-        'filterByFormula': 'OR({notified} = 0, NOT({notified}))'
+        'filterByFormula': formula,
+        'pageSize': page_size,
+        'fields[]': list(NOTIFY_FIELDS)
     }
 
-    response = requests.get(url, headers=HEADERS, params=params)
-    response.raise_for_status()
-    records = response.json().get('records', [])
-    logging.info(f"Found {len(records)} unnotified accepted records.")
-    return records
+    total = 0
+    for records in airtable.iter_pages(TABLE_NAME, params):
+        page = [AcceptedRecord.from_api(record) for record in records]
+        total += len(page)
+        yield page
 
+    logging.info(f"Found {total} unnotified accepted records.")
 
-def send_sms_notification(phone_number, song_title):
-    configuration = clicksend_client.Configuration()
-    configuration.username = CLICKSEND_USERNAME
-    configuration.password = CLICKSEND_API_KEY
 
-    api_instance = clicksend_client.SMSApi(clicksend_client.ApiClient(configuration))
+def iter_accepted_unnotified_records(page_size=ACCEPTED_PAGE_SIZE):
+    for page in iter_accepted_unnotified_pages(page_size):
+        yield from page
 
-    message = SmsMessage(
-        source="python",
-        body=f"Your song request for '{song_title}' has been accepted! Stick close to the dance floor it's playing soon!",
-        to=phone_number,
-        custom_string="NxtSong"
-    )
 
-    sms_messages = clicksend_client.SmsMessageCollection(messages=[message])
+def get_accepted_unnotified_records():
+    return list(iter_accepted_unnotified_records())
 
-    try:
-        response = api_instance.sms_send_post(sms_messages)
-        print(f"SMS sent to {phone_number}: {response}")
-    except ApiException as e:
-        print(f"ClickSend SMS failed: {e}")
 
-def mark_as_notified(record_id):
-    url = f'https://api.airtable.com/v0/{BASE_ID}/{TABLE_NAME}/{record_id}'
+def send_sms_notification(phone_number, song_title, record_id="NxtSong"):
+    """Sends a single accepted-song text; returns True if ClickSend accepted it."""
+    sent = sms_dispatcher.send_batch([(record_id, phone_number, song_title)])
+    return record_id in sent
+
+def queue_mark_as_notified(record_id):
+    """
+    Queues the notified update on the shared batch writer and returns a Future
+    for it, so a cycle's updates go out in 10-record PATCH calls.
+    """
     data = {
-        "fields": {
-            "notified": True,
-            "notified_at": datetime.now(timezone.utc).isoformat()
-        }
+        "notified": True,
+        "notified_at": datetime.now(timezone.utc).isoformat()
     }
+    return batch_writer.update(TABLE_NAME, record_id, data)
 
-    response = requests.patch(url, headers=HEADERS, json=data)
-    response.raise_for_status()
-    logging.info(f"Marked record {record_id} as notified.")
+def mark_as_notified(record_id):
+    queue_mark_as_notified(record_id).result()
+    logging.info(f"Marked record {record_id} as notified.", extra=SAMPLED)
 
-def lookup_connect_id_by_gig_id(gig_id):
+def _cache_gig_fields(gig_id, fields):
+    connect_id = (fields or {}).get('stripe_connect_id') or ''
+    ttl = GIG_CACHE_TTL_SECONDS if connect_id else GIG_CACHE_NEGATIVE_TTL_SECONDS
+    connect_id_cache.set(gig_id, connect_id, ttl=ttl)
+    return connect_id
+
+
+def fetch_connect_id(gig_id):
     """
-    Helper function to lookup the DJ's Stripe connect ID based on gig_id.
+    Cached gig -> stripe_connect_id lookup shared by the scheduler and the API.
+    Returns the connect ID, '' if the gig has no stripe_connect_id, or None if
+    no gig matches. Both negative results are cached for a shorter TTL.
     """
-    search_url = f"https://api.airtable.com/v0/{BASE_ID}/gigs_tbl"
-    headers = {
-        "Authorization": f"Bearer {AIRTABLE_API_KEY}",
-        "Content-Type": "application/json"
-    }
+    cached = connect_id_cache.get(gig_id)
+    if cached is _NO_GIG:
+        return None
+    if cached is not None:
+        return cached
+
+    return _connect_id_lookups.do(gig_id, lambda: _fetch_connect_id_uncached(gig_id))
+
+
+def _fetch_connect_id_uncached(gig_id):
     params = {
-        "filterByFormula": f"gig_id='{gig_id}'",
+        "filterByFormula": f"gig_id={formula_string(gig_id)}",
         "maxRecords": 1
     }
 
-    response = requests.get(search_url, headers=headers, params=params)
-    response.raise_for_status()
-
-    records = response.json().get('records', [])
+    records = airtable.get(GIGS_TABLE_NAME, params=params).json().get('records', [])
     if not records:
-        raise ValueError(f"No gig found for gig_id: {gig_id}")
+        connect_id_cache.set(gig_id, _NO_GIG, ttl=GIG_CACHE_NEGATIVE_TTL_SECONDS)
+        return None
+
+    return _cache_gig_fields(gig_id, records[0]['fields'])
+
+
+def warm_connect_id_cache(gig_ids):
+    """
+    Loads every uncached gig in `gig_ids` with one OR(...) query per chunk
+    instead of one lookup per gig.
+    """
+    pending = sorted({gig_id for gig_id in gig_ids if gig_id and gig_id not in connect_id_cache})
+    if not pending:
+        return
+
+    for i in range(0, len(pending), GIG_WARM_CHUNK_SIZE):
+        chunk = pending[i:i + GIG_WARM_CHUNK_SIZE]
+        clauses = ", ".join(f"gig_id={formula_string(gig_id)}" for gig_id in chunk)
+        params = {
+            "filterByFormula": f"OR({clauses})",
+            "fields[]": ["gig_id", "stripe_connect_id"]
+        }
 
-    fields = records[0]['fields']
-    connect_id = fields.get('stripe_connect_id')
+        found = set()
+        for record in airtable.iter_records(GIGS_TABLE_NAME, params):
+            gig_id = record['fields'].get('gig_id')
+            if gig_id and gig_id not in found:
+                found.add(gig_id)
+                _cache_gig_fields(gig_id, record['fields'])
+
+        for gig_id in set(chunk) - found:
+            connect_id_cache.set(gig_id, _NO_GIG, ttl=GIG_CACHE_NEGATIVE_TTL_SECONDS)
+
+    logging.info(f"Warmed connect ID cache with {len(pending)} gig(s).")
+
+
+def lookup_connect_id_by_gig_id(gig_id):
+    """
+    Helper function to lookup the DJ's Stripe connect ID based on gig_id.
+    """
+    connect_id = fetch_connect_id(gig_id)
+    if connect_id is None:
+        raise ValueError(f"No gig found for gig_id: {gig_id}")
 
     if not connect_id:
         raise ValueError(f"No stripe_connect_id found for gig_id: {gig_id}")
@@ -99,67 +205,249 @@ def lookup_connect_id_by_gig_id(gig_id):
     return connect_id
 
 
+def charge_record(record):
+    """
+    Runs the gig lookup and charge step for a single AcceptedRecord.
+    Returns True if the customer was charged and the record can move on to
+    the SMS and mark steps.
+    """
+    record_id = record.record_id
+    customer_id = record.customer_id
+    request_id = record.request_id
+    gig_id = record.gig_id  # 🆕 We now use gig_id from the song request record
+
+    if not record.is_complete():
+        logging.warning(f"Missing data for record {record_id}, skipping.")
+        return False
+
+    # 🆕 Lookup DJ connect ID dynamically
+    try:
+        dj_connect_id = lookup_connect_id_by_gig_id(gig_id)
+    except Exception as e:
+        logging.error(f"Failed to lookup connect ID for gig_id {gig_id}: {e}")
+        return False
+
+    # Step 1: Attempt to charge the customer (in-process, no HTTP hop through /charge-customer)
+    try:
+        payment_intent = charge_customer(
+            customer_id=customer_id,
+            payment_method_id=record.payment_method_id,
+            bid_amount=record.bid_amount,  # e.g. "2.50"
+            request_id=request_id,
+            connected_account_id=dj_connect_id
+        )
+        logging.info(f"Charged customer {customer_id} for request {request_id} ({payment_intent.id})", extra=SAMPLED)
+    except Exception as e:
+        logging.error(f"Charge failed for customer {customer_id}, request {request_id}: {e}")
+        return False  # Skip SMS and update if charge failed
+
+    # Persist before moving on so a later failure resumes at the SMS step instead of charging again
+    notify_outbox.advance(record_id, notify_outbox.CHARGED, request_id=request_id,
+                          payment_intent_id=payment_intent.id)
+    return True
+
+
+def _charge_record_safely(record):
+    # Keep one bad record from taking down the rest of the worker pool
+    try:
+        return charge_record(record)
+    except Exception as e:
+        logging.error(f"Unexpected error processing record {record.record_id}: {e}")
+        return False
+
+
+def _notify_page(records, workers, honor_backoff=False):
+    """
+    Runs charge -> SMS -> mark for one page of AcceptedRecord and returns how
+    many were marked notified. Charges run on the worker pool; the SMS and
+    mark steps are batched across the page, and a record only moves to the
+    next step once its previous step succeeded. Finished steps are recorded
+    in the notify outbox, so a retried record resumes after its last finished
+    step and is never charged twice. Outcomes go to the attempt ledger; with
+    `honor_backoff`, records still backing off are skipped unless they were
+    edited since they last failed.
+    """
+    fingerprints = {record.record_id: record.fingerprint() for record in records}
+    if honor_backoff:
+        waiting = notify_state.backing_off(fingerprints, fingerprints)
+        if waiting:
+            logging.info(f"Skipping {len(waiting)} record(s) still backing off after failed attempts.")
+            records = [record for record in records if record.record_id not in waiting]
+        if not records:
+            return 0
+
+    failures = {}
+    steps = notify_outbox.get_steps(record.record_id for record in records)
+    done = {record_id: step for record_id, (step, _) in steps.items()}
+    to_charge = [record for record in records if done.get(record.record_id, notify_outbox.PENDING) == notify_outbox.PENDING]
+    # Already charged on an earlier run: resume at the SMS step
+    charged_records = [record for record in records if done.get(record.record_id) == notify_outbox.CHARGED]
+    # Already texted (or marked but still showing as unnotified): resume at the mark step
+    to_mark = [record for record in records if done.get(record.record_id) in (notify_outbox.TEXTED, notify_outbox.MARKED)]
+    if len(to_charge) < len(records):
+        logging.info(f"Resuming {len(records) - len(to_charge)} record(s) from the notify outbox.")
+
+    # Resolve every gig on this page with a single query up front
+    if to_charge:
+        try:
+            warm_connect_id_cache(record.gig_id for record in to_charge)
+        except Exception as e:
+            logging.warning(f"Failed to warm connect ID cache: {e}")
+
+    # Step 1: charge
+    if workers == 1 or len(to_charge) <= 1:
+        charged = [_charge_record_safely(record) for record in to_charge]
+    else:
+        with ThreadPoolExecutor(max_workers=min(workers, len(to_charge)), thread_name_prefix="notify") as pool:
+            charged = list(pool.map(_charge_record_safely, to_charge))
+    for record, ok in zip(to_charge, charged):
+        if ok:
+            charged_records.append(record)
+        else:
+            failures[record.record_id] = "charge step failed"
+
+    # Step 2: one ClickSend call per batch of charged records
+    sent = set()
+    if charged_records:
+        sent = sms_dispatcher.send_batch([
+            (record.record_id, record.phone_number, record.song_name) for record in charged_records
+        ])
+    for record in charged_records:
+        if record.record_id in sent:
+            _advance_outbox(record.record_id, notify_outbox.TEXTED)
+            to_mark.append(record)
+            logging.info(f"SMS sent for record {record.record_id}", extra=SAMPLED)
+        else:
+            failures[record.record_id] = "SMS step failed"
+            logging.error(f"Failed to send SMS for record {record.record_id}; left unnotified.")
+
+    # Step 3: mark only records whose SMS went out, in 10-record PATCH batches
+    pending = [(record, queue_mark_as_notified(record.record_id)) for record in to_mark]
+    batch_writer.flush()
+    succeeded = []
+    for record, future in pending:
+        try:
+            future.result()
+            succeeded.append(record.record_id)
+            _advance_outbox(record.record_id, notify_outbox.MARKED)
+            # Notified requests are done; take them off the gig's live leaderboard
+            request_board.discard(record.gig_id, record.request_id)
+            logging.info(f"Record {record.record_id} marked as notified.", extra=SAMPLED)
+        except Exception as e:
+            failures[record.record_id] = f"mark step failed: {e}"
+            logging.error(f"Failed to mark record {record.record_id} as notified: {e}")
+
+    _update_attempt_ledger(succeeded, failures, fingerprints)
+    return len(succeeded)
+
+
+def _advance_outbox(record_id, step):
+    # The step already happened remotely; a local write failure only costs a repeated SMS or PATCH later
+    try:
+        notify_outbox.advance(record_id, step)
+    except Exception as e:
+        logging.warning(f"Failed to record step '{step}' for record {record_id} in notify outbox: {e}")
+
+
+def _update_attempt_ledger(succeeded, failures, fingerprints):
+    try:
+        notify_state.clear(succeeded)
+        for record_id, error in failures.items():
+            attempts = notify_state.record_failure(record_id, error, fingerprints.get(record_id))
+            if attempts > 1:
+                logging.warning(f"Record {record_id} has failed {attempts} times; backing off.")
+    except Exception as e:
+        logging.warning(f"Failed to update notify attempt ledger: {e}")
+
+
+def _notify_by_ids(record_ids, workers):
+    """Runs the pipeline for specific record ids; returns (matched, notified)."""
+    matched = notified = 0
+    for i in range(0, len(record_ids), GIG_WARM_CHUNK_SIZE):
+        chunk = record_ids[i:i + GIG_WARM_CHUNK_SIZE]
+        clauses = ", ".join(f"RECORD_ID()={formula_string(record_id)}" for record_id in chunk)
+        found = set()
+        for page in iter_accepted_unnotified_pages(extra_formula=f"OR({clauses})"):
+            matched += len(page)
+            found.update(record.record_id for record in page)
+            notified += _notify_page(page, min(workers, len(page)))
+        # Anything no longer accepted-and-unnotified needs no further retries
+        notify_state.clear(set(chunk) - found)
+    return matched, notified
+
+
+def notify_records(record_ids):
+    """
+    Runs the notify pipeline immediately for specific records, e.g. ones the
+    acceptance webhook queued. Records that are not in accepted_view or are
+    already notified are ignored. Returns how many were marked notified.
+    """
+    record_ids = sorted(set(record_ids))
+    started = time.monotonic()
+
+    with _pipeline_lock:
+        _, notified = _notify_by_ids(record_ids, max(1, NOTIFY_MAX_WORKERS))
+
+    metrics.notify_outcomes.inc(notified, outcome='notified')
+    metrics.notify_outcomes.inc(len(record_ids) - notified, outcome='not_notified')
+    elapsed = time.monotonic() - started
+    logging.info(f"Triggered notify done: {notified}/{len(record_ids)} records notified in {elapsed:.2f}s.")
+    return notified
+
+
 def check_and_notify():
+    """
+    Incremental poll: fetches only accepted records modified since the stored
+    high-water mark (LAST_MODIFIED_TIME()), then retries ledger records whose
+    backoff has expired. Records still backing off are skipped unless edited
+    since their last failure. A full sweep runs on first start and every
+    NOTIFY_FULL_SWEEP_HOURS as a safety net.
+    """
     logging.info("Running check_and_notify task...")
+    started = time.monotonic()
 
     try:
-        records = get_accepted_unnotified_records()
-        if not records:
+        seen = notified = 0
+        workers = max(1, NOTIFY_MAX_WORKERS)
+        cycle_started_at = time.time()
+
+        with _pipeline_lock:
+            cursor = notify_state.get_value(CURSOR_KEY)
+            last_full_sweep = float(notify_state.get_value(FULL_SWEEP_KEY, "0"))
+            full_sweep = not cursor or cycle_started_at - last_full_sweep >= NOTIFY_FULL_SWEEP_HOURS * 3600
+            extra_formula = None if full_sweep else f"IS_AFTER(LAST_MODIFIED_TIME(), '{cursor}')"
+
+            for page in iter_accepted_unnotified_pages(extra_formula=extra_formula):
+                seen += len(page)
+                notified += _notify_page(page, min(workers, len(page)), honor_backoff=True)
+
+            # Failed records whose backoff has expired are fetched by id, not by rescanning the view
+            due = notify_state.due_record_ids()
+            metrics.notify_retry_backlog.set(len(due))
+            if due:
+                matched, retried = _notify_by_ids(due, workers)
+                seen += matched
+                notified += retried
+
+            notify_state.set_value(CURSOR_KEY, utc_iso(cycle_started_at - AIRTABLE_CURSOR_OVERLAP_SECONDS))
+            if full_sweep:
+                notify_state.set_value(FULL_SWEEP_KEY, str(cycle_started_at))
+                notify_outbox.prune()
+
+        elapsed = time.monotonic() - started
+        metrics.notify_cycle_latency.observe(elapsed, mode='full' if full_sweep else 'incremental')
+        metrics.notify_backlog.set(seen)
+        metrics.notify_outcomes.inc(notified, outcome='notified')
+        metrics.notify_outcomes.inc(seen - notified, outcome='not_notified')
+
+        if not seen:
             logging.info("No new accepted records to process.")
             return
 
-        for record in records:
-            fields = record['fields']
-            record_id = record['id']
-            phone = fields.get('phone_number')
-            song = fields.get('song_name')
-            customer_id = fields.get('customer_id')
-            payment_method_id = fields.get('payment_method_id')
-            bid_amount = fields.get('bid_amount')  # e.g. "2.50"
-            request_id = fields.get('request_id')
-            gig_id = fields.get('gig_id')  # 🆕 We now use gig_id from the song request record
-
-            if not all([phone, song, customer_id, payment_method_id, bid_amount, request_id, gig_id]):
-                logging.warning(f"Missing data for record {record_id}, skipping.")
-                continue
-
-            # 🆕 Lookup DJ connect ID dynamically
-            try:
-                dj_connect_id = lookup_connect_id_by_gig_id(gig_id)
-            except Exception as e:
-                logging.error(f"Failed to lookup connect ID for gig_id {gig_id}: {e}")
-                continue
-
-            # Step 1: Attempt to charge the customer
-            try:
-                payload = {
-                    "customer_id": customer_id,
-                    "payment_method_id": payment_method_id,
-                    "bid_amount": bid_amount,
-                    "request_id": request_id,
-                    "dj_connect_id": dj_connect_id
-                }
-                charge_response = requests.post(CHARGE_CUSTOMER_URL, json=payload)
-                charge_response.raise_for_status()
-                logging.info(f"Charged customer {customer_id} for request {request_id}")
-            except Exception as e:
-                logging.error(f"Charge failed for customer {customer_id}, request {request_id}: {e}")
-                continue  # Skip SMS and update if charge failed
-
-            # Step 2: Send SMS after successful charge
-            try:
-                send_sms_notification(phone, song)
-                logging.info(f"SMS sent to {phone} for song '{song}'")
-            except Exception as e:
-                logging.error(f"Failed to send SMS to {phone}: {e}")
-                continue  # Skip update if SMS fails
-
-            # Step 3: Mark record as notified
-            try:
-                mark_as_notified(record_id)
-                logging.info(f"Record {record_id} marked as notified.")
-            except Exception as e:
-                logging.error(f"Failed to mark record {record_id} as notified: {e}")
+        logging.info(
+            f"check_and_notify cycle done ({'full sweep' if full_sweep else 'incremental'}): "
+            f"{notified}/{seen} records notified in {elapsed:.2f}s with up to {workers} worker(s)."
+        )
 
     except Exception as e:
         logging.error(f"Error during scheduled check: {e}")
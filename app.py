@@ -1,37 +1,124 @@
-from flask import Flask, request, jsonify , redirect
+from flask import Flask, request, jsonify , redirect, g, Response, stream_with_context
 from flask_cors import CORS
-import stripe
 import os
-import traceback
+import threading
+import hmac
+import itertools
+import math
 import requests
 from scheduler import start_scheduler
+from airtable_utils import fetch_connect_id
+from airtable_batch import batch_writer
+from airtable_client import airtable
+import charge_service
+import customer_index
+import local_db
+import metrics
+import notify_queue
+import qr_codes
+import settlement
+from request_board import request_board, board_etag, ensure_gig_loaded, REQUEST_BOARD_REFRESH_SECONDS
+import geocode
+from admission import admission_controlled
+import write_behind
 import logging
+import time
 import urllib.parse
-from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderTimedOut
+from structured_logging import configure_logging, SAMPLED
+from geocode import get_coordinates
+from airtable_client import unknown_field_name
+from gig_index import (gig_index, gig_info, gig_exists, note_gig, coordinate_fields, coordinates_unsupported,
+                       ensure_gig_index_fresh, GIG_COORDINATE_FIELDS)
 
 #updated virtual environment to correct one
 app = Flask(__name__)
 CORS(app)  # Allow all origins by default
-# Stripe Secret Key from environment variable
-stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+# Stripe itself is imported lazily by charge_service (it takes over a second to import)
 STRIPE_PUBLISHABLE_KEY = os.getenv("STRIPE_PUBLISHABLE_KEY")
 # Set your Airtable credentials
 AIRTABLE_API_KEY = os.getenv("AIRTABLE_API_KEY")
 AIRTABLE_BASE_ID = os.getenv("AIRTABLE_BASE_ID")
 AIRTABLE_TABLE_NAME = 'song_requests_tbl'
-geolocator = Nominatim(user_agent="dj_locator")
-AIRTABLE_API_URL = f'https://api.airtable.com/v0/{AIRTABLE_BASE_ID}/{AIRTABLE_TABLE_NAME}'
-HEADERS = {
-    'Authorization': f'Bearer {AIRTABLE_API_KEY}',
-    'Content-Type': 'application/json'
-}
-
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-
-# Start the scheduler on app startup
-start_scheduler()
+NOTIFY_WEBHOOK_SECRET = os.getenv("NOTIFY_WEBHOOK_SECRET")
+# Optional bearer token required to scrape /metrics
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+# Bearer token for /settlement-report; the report stays off until one is set
+SETTLEMENT_REPORT_TOKEN = os.getenv("SETTLEMENT_REPORT_TOKEN")
+# Bearer token for /charge-customers; bulk charging stays off until one is set
+CHARGE_BATCH_TOKEN = os.getenv("CHARGE_BATCH_TOKEN")
+# 'sync' waits for the Airtable create; 'async' queues it locally and answers 202 right away
+SONG_REQUEST_INGEST_MODE = os.getenv("SONG_REQUEST_INGEST_MODE", "sync").lower()
+# Public origin of this service; gig QR codes stored in Airtable point back at it
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "https://stripe-intent-python-script.onrender.com").rstrip('/')
+# Browsers and CDNs keep gig QR images this long, then revalidate against the ETag
+QR_CACHE_MAX_AGE = int(os.getenv("QR_CACHE_MAX_AGE", str(7 * 24 * 3600)))
+# Bounds for /gigs/<gig_id>/requests: entries per response and long-poll wait (kept under gunicorn's timeout)
+LEADERBOARD_MAX_LIMIT = 100
+LEADERBOARD_MAX_WAIT_SECONDS = 25
+
+# A 202 promises the request is saved, so the queue must live on a disk that outlasts a deploy
+if SONG_REQUEST_INGEST_MODE == 'async' and not local_db.STATE_DIR_CONFIGURED:
+    raise EnvironmentError("SONG_REQUEST_INGEST_MODE=async needs STATE_DIR set to a persistent disk.")
+
+# Configure logging (JSON lines, redacted, written by a background thread)
+configure_logging()
+
+_background_started = False
+_background_lock = threading.Lock()
+
+def warm_sdks():
+    # Load the centroid tables and import the slow SDKs off the request path,
+    # so the first lookup, charge or text doesn't pay for it
+    try:
+        geocode.load_centroids()
+        charge_service.load_stripe()
+        import clicksend_client  # noqa: F401
+        geocode.get_geolocator()
+    except Exception as e:
+        logging.warning("⚠️ SDK warm-up failed: %s", e)
+
+def start_background_services():
+    """
+    Starts this worker's background work: scheduler leader election, the
+    write-behind flusher, the nearby-gigs index sync and SDK warm-up. Gunicorn runs it after the fork (post_worker_init in
+    gunicorn.conf.py); otherwise the first request starts it. Later calls are
+    no-ops.
+    """
+    global _background_started
+    with _background_lock:
+        if _background_started:
+            return
+        _background_started = True
+
+    start_scheduler()
+    # Drain any Airtable writes left queued by a previous process
+    write_behind.start_flusher()
+    # Build the nearby-gigs index in the background
+    ensure_gig_index_fresh()
+    threading.Thread(target=warm_sdks, name="sdk-warmup", daemon=True).start()
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if not _background_started:
+        threading.Thread(target=start_background_services, name="background-start", daemon=True).start()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        # The URL rule, not the raw path, so ids in paths don't create new series
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.route_latency.observe(time.perf_counter() - started, method=request.method, route=route)
+        metrics.route_responses.inc(method=request.method, route=route, status=response.status_code)
+    return response
+
+# Prometheus scrape endpoint (per worker process)
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    if METRICS_TOKEN and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {METRICS_TOKEN}'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route("/", methods=["GET"])
 def home():
@@ -42,61 +129,67 @@ def home():
 def create_setup_intent():
     try:
         data = request.get_json()
-        logging.info("📥 Received request data: %s", data)
+        logging.debug("📥 Received request data: %s", data)
 
         customer_name = data.get('customer_name')
         email = data.get('email')
         phone_number = data.get('phone_number')
         offer_id = data.get('offer_id')
+        customer_token = data.get('customer_token')
 
         if not all([customer_name, email, phone_number, offer_id]):
             logging.error("❌ Missing required fields.")
             return jsonify({'error': 'Missing required fields.'}), 400
 
-        # 1️⃣ Create Stripe Customer
-        logging.info("👤 Creating Stripe customer...")
-        customer = stripe.Customer.create(
+        # 1️⃣ Reuse the guest's Stripe Customer (only with their signed customer_token), or create one
+        customer_id, created = customer_index.resolve_customer(
+            customer_token=customer_token,
             email=email,
             name=customer_name,
             phone=phone_number,
             metadata={"offer_id": offer_id}
         )
-        logging.info("✅ Stripe customer created: %s", customer)
+        if created:
+            logging.info("✅ Stripe customer created: %s", customer_id, extra=SAMPLED)
+        else:
+            logging.info("♻️ Reusing Stripe customer: %s", customer_id, extra=SAMPLED)
 
         # 2️⃣ Create SetupIntent
-        logging.info("💳 Creating SetupIntent...")
-        setup_intent = stripe.SetupIntent.create(
-            customer=customer.id,
+        setup_intent = charge_service.stripe.SetupIntent.create(
+            customer=customer_id,
             payment_method_types=["card"],
             usage="off_session"
         )
-        logging.info("✅ SetupIntent created: %s", setup_intent)
-
-        # 3️⃣ Create Airtable record directly
-        record_id = None
-        try:
-            airtable_result = create_airtable_customer_record(
-                stripe_id=customer.id,
-                customer_name=customer_name,
-                email=email,
-                phone_number=phone_number
-            )
-            record_id = airtable_result.get("id")
-            logging.info("🧾 Airtable record ID: %s", record_id)
-        except Exception as e:
-            logging.warning("⚠️ Airtable record creation failed: %s", str(e))
-
-        # 4️⃣ Return all setup intent data (including Airtable record if available)
+        logging.info("✅ SetupIntent created: %s", setup_intent.id, extra=SAMPLED)
+
+        # 3️⃣ Queue the Airtable record for new customers (write-behind; the response doesn't depend on it)
+        if created:
+            try:
+                queue_id = queue_airtable_customer_record(
+                    stripe_id=customer_id,
+                    customer_name=customer_name,
+                    email=email,
+                    phone_number=phone_number
+                )
+                logging.info("🧾 Airtable customer record queued: %s", queue_id, extra=SAMPLED)
+            except Exception as e:
+                logging.warning("⚠️ Airtable record queueing failed: %s", str(e))
+
+        # 4️⃣ Return all setup intent data
         response_payload = {
             "clientSecret": setup_intent.client_secret,
             "publishableKey": STRIPE_PUBLISHABLE_KEY,
-            "customer_id": customer.id
+            "customer_id": customer_id,
+            "customer_token": customer_index.issue_customer_token(customer_id)
         }
+        # A returning guest's saved card (their token proved the customer is theirs), so the frontend can offer it
+        saved_payment_method = None if created else customer_index.saved_payment_method(customer_id)
+        if saved_payment_method:
+            response_payload["payment_method_id"] = saved_payment_method
 
-        logging.info("📦 Returning setup response: %s", response_payload)
         return jsonify(response_payload)
 
-    except stripe.error.StripeError as e:
+    except charge_service.stripe.error.StripeError as e:
         logging.error("❌ Stripe error: %s", e.user_message)
         logging.error("🔎 Stripe error details: %s", e.json_body)
         return jsonify({
@@ -112,9 +205,12 @@ def create_setup_intent():
             "details": str(e)
         }), 500
    
-def create_airtable_customer_record(stripe_id, customer_name, email, phone_number):
+def queue_airtable_customer_record(stripe_id, customer_name, email, phone_number):
+    """
+    Durably queues the customers_tbl record; the write-behind flusher creates
+    it in Airtable (batched, with retry) off the request path.
+    """
     CUSTOMER_TABLE_NAME = 'customers_tbl'
-    AIRTABLE_API_CUSTOMER_URL = f'https://api.airtable.com/v0/{AIRTABLE_BASE_ID}/{CUSTOMER_TABLE_NAME}'
     if not AIRTABLE_API_KEY or not AIRTABLE_BASE_ID:
         raise EnvironmentError("Missing Airtable API credentials in environment.")
 
@@ -127,36 +223,11 @@ def create_airtable_customer_record(stripe_id, customer_name, email, phone_numbe
         }
     }
 
-    logging.info("📤 Posting Airtable payload: %s", airtable_data)
-
-    response = requests.post(AIRTABLE_API_CUSTOMER_URL, json=airtable_data, headers=HEADERS)
-    response.raise_for_status()
-
-    logging.info("✅ Airtable record created: %s", response.json())
-    return response.json()
-
-#GEOCODE ZIP CODE OR CITY,STATE IN ORDER TO GET COORDINATES
-def get_coordinates(city=None, state=None, zip_code=None):
-    try:
-        if zip_code:
-            query = zip_code
-        elif city and state:
-            query = f"{city}, {state}"
-        else:
-            raise ValueError("Either ZIP code or both city and state must be provided.")
-
-        location = geolocator.geocode(query, timeout=10)
-
-        if not location:
-            raise LookupError(f"Could not find coordinates for: {query}")
-
-        return (location.latitude, location.longitude)
-
-    except GeocoderTimedOut:
-        raise TimeoutError("Geocoding service timed out. Please try again.")
-
+    logging.debug("📤 Queueing Airtable payload: %s", airtable_data)
+    return write_behind.enqueue_create(CUSTOMER_TABLE_NAME, airtable_data['fields'])
 
 @app.route('/create-song-request-record', methods=['POST'])
+@admission_controlled
 def create_request():
     try:
         # Check that environment variables are set
@@ -184,6 +255,8 @@ def create_request():
             bid_amount = float(bid_amount)
         except ValueError:
             return jsonify({'error': 'Invalid bid_amount. Must be a number.'}), 400
+        if not math.isfinite(bid_amount):
+            return jsonify({'error': 'Invalid bid_amount. Must be a number.'}), 400
 
         # Prepare Airtable payload
         airtable_data = {
@@ -199,35 +272,78 @@ def create_request():
             }
         }
 
-        # Log values for debugging
-        print("Posting to Airtable:")
-        print("URL:", AIRTABLE_API_URL)
-        print("Headers:", HEADERS)
-        print("Payload:", airtable_data)
+        # Ingest mode: durably queue and acknowledge; the write-behind flusher batch-creates 10 at a time
+        if SONG_REQUEST_INGEST_MODE == 'async':
+            write_behind.enqueue_create(AIRTABLE_TABLE_NAME, airtable_data['fields'])
+            request_board.add(gig_id, airtable_data['fields'])
+            return jsonify({'message': 'Request accepted', 'request_id': request_id}), 202
 
-        # Send request to Airtable
-        response = requests.post(AIRTABLE_API_URL, json=airtable_data, headers=HEADERS)
+        logging.debug("📤 Posting to Airtable %s: %s", AIRTABLE_TABLE_NAME, airtable_data)
 
-        # Raise error if response is not OK
-        response.raise_for_status()
+        # Send request to Airtable (batched with concurrent submissions, raises on failure)
+        record = batch_writer.create(AIRTABLE_TABLE_NAME, airtable_data['fields']).result()
+        request_board.add(gig_id, airtable_data['fields'])
 
-        record_id = response.json().get('id')
+        record_id = record.get('id')
         return jsonify({'message': 'Request created successfully', 'record_id': record_id}), 200
 
     except requests.exceptions.RequestException as e:
-        print("Airtable API error:")
-        traceback.print_exc()
+        logging.error("Airtable API error:", exc_info=True)
         return jsonify({'error': 'Airtable API error', 'details': str(e)}), 500
 
     except Exception as e:
-        print("General error:")
-        traceback.print_exc()
+        logging.error("General error:", exc_info=True)
         return jsonify({'error': 'Internal server error', 'details': str(e)}), 500
 
+@app.route('/gigs/<path:gig_id>/requests', methods=['GET'])
+@admission_controlled
+def gig_requests(gig_id):
+    """
+    Pending requests for a gig, highest bid first. Send the last ETag in
+    If-None-Match with ?wait=<seconds> to long-poll: the response comes as
+    soon as the leaderboard changes, or as a 304 when the wait runs out.
+    """
+    limit = min(max(request.args.get('limit', 20, type=int), 1), LEADERBOARD_MAX_LIMIT)
+    wait = request.args.get('wait', 0, type=float)
+    if not math.isfinite(wait):
+        return jsonify({'error': 'wait must be a number of seconds'}), 400
+    wait = min(max(wait, 0), LEADERBOARD_MAX_WAIT_SECONDS)
+
+    # Only real gigs get a board: an unknown gig_id would cost an Airtable scan and push real gigs out
+    ensure_gig_index_fresh()
+    exists = gig_exists(gig_id)
+    if exists is None:
+        response = jsonify({'error': 'Gig list is still loading, please retry'})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    if not exists:
+        return jsonify({'error': 'Unknown gig'}), 404
+    try:
+        ensure_gig_loaded(gig_id)
+
+        version = request_board.version(gig_id)
+        if wait and board_etag(version, limit) in request.if_none_match:
+            deadline = time.monotonic() + wait
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or request_board.wait_for_change(gig_id, version, min(remaining, REQUEST_BOARD_REFRESH_SECONDS)):
+                    break
+                # Picks up requests written through other workers while we wait
+                ensure_gig_loaded(gig_id)
+
+        version, total, top = request_board.top(gig_id, limit)
+        response = jsonify({'gig_id': gig_id, 'total': total, 'requests': top})
+        response.set_etag(board_etag(version, limit))
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
+    except requests.exceptions.RequestException as e:
+        logging.error("Airtable API error:", exc_info=True)
+        return jsonify({'error': 'Airtable API error', 'details': str(e)}), 500
+
 @app.route('/create-gig-record', methods=['POST'])
 def create_gig():
     gigs_tbl_name = 'gigs_tbl'
-    AIRTABLE_API_URL_GIGS = f'https://api.airtable.com/v0/{AIRTABLE_BASE_ID}/{gigs_tbl_name}'
     try:
         # Check that environment variables are set
         if not AIRTABLE_API_KEY or not AIRTABLE_BASE_ID:
@@ -254,14 +370,17 @@ def create_gig():
             'state': state
         }
 
-        # ✅ Step 2: URL-encode the parameters safely
-        encoded_params = urllib.parse.urlencode(params)
-
-        # ✅ Step 3: Generate the final Tally form URL
-        generated_form_url = f'https://tally.so/r/wvKEk4?{encoded_params}'
+        # ✅ Steps 2-3: Generate the final Tally form URL (URL-encoded)
+        generated_form_url = qr_codes.gig_form_url(params)
 
-        # ✅ Step 4: Generate QR code URL based on the safe, encoded form URL
-        qr_code_url = f"https://api.qrserver.com/v1/create-qr-code/?data={urllib.parse.quote(generated_form_url)}&size=800x800"
+        # ✅ Step 4: Render the QR code for the form URL once, locally, and serve it from /gigs/<gig_id>/qr.png
+        try:
+            qr_codes.render_gig_qr(gig_id, generated_form_url)
+            qr_code_url = (f"{PUBLIC_BASE_URL}/gigs/{urllib.parse.quote(gig_id, safe='')}/qr.png"
+                           f"?size={qr_codes.QR_DEFAULT_SIZE}")
+        except Exception as e:
+            logging.warning("⚠️ Local QR render failed for %s, using qrserver: %s", gig_id, e)
+            qr_code_url = f"https://api.qrserver.com/v1/create-qr-code/?data={urllib.parse.quote(generated_form_url)}&size=800x800"
 
         # Prepare Airtable payload
         airtable_data = {
@@ -270,49 +389,145 @@ def create_gig():
                 'venue': venue,
                 'city': city,
                 'state': state,
-                'gig_url': qr_code_url
+                'gig_url': qr_code_url,
+                # Lets any instance re-render the QR code after a deploy wipes local state
+                qr_codes.FORM_URL_FIELD: generated_form_url
             }
         }
 
-        # Log values for debugging
-        print("Posting to Airtable:")
-        print("URL:", AIRTABLE_API_URL_GIGS)
-        print("Headers:", HEADERS)
-        print("Payload:", airtable_data)
-
-        
-        response = requests.post(AIRTABLE_API_URL_GIGS, json=airtable_data, headers=HEADERS)
-
-        # Raise error if response is not OK
-        # Send request to Airtable
-        print("Airtable Response:", response.status_code, response.text)
-        response.raise_for_status()
+        # Geocode once here and store it on the gig, so /nearby-gigs never has to look it up again
+        coordinates = None
+        try:
+            coordinates = get_coordinates(city=city, state=state)
+        except Exception as e:
+            logging.warning("⚠️ Could not geocode gig %s: %s", gig_id, e)
+        if coordinates:
+            airtable_data['fields'].update(coordinate_fields(*coordinates))
+
+        logging.debug("📤 Posting to Airtable %s: %s", gigs_tbl_name, airtable_data)
+
+        # Send request to Airtable (raises on a non-OK response)
+        optional_fields = set(GIG_COORDINATE_FIELDS) | {qr_codes.FORM_URL_FIELD}
+        while True:
+            try:
+                response = airtable.post(gigs_tbl_name, json=airtable_data)
+                break
+            except requests.exceptions.HTTPError as e:
+                # gigs_tbl doesn't have this optional field yet; create the gig without it
+                name = unknown_field_name(e)
+                if name not in optional_fields or name not in airtable_data['fields']:
+                    raise
+                logging.warning("⚠️ gigs_tbl has no %s field; creating gig %s without it", name, gig_id)
+                if name in GIG_COORDINATE_FIELDS:
+                    coordinates_unsupported()
+                    for coordinate in GIG_COORDINATE_FIELDS:
+                        airtable_data['fields'].pop(coordinate, None)
+                else:
+                    airtable_data['fields'].pop(name)
+        logging.info("✅ Gig record created for %s", gig_id, extra=SAMPLED)
+        note_gig(gig_id)
+
+        # Add it to this worker's index right away; other workers pick it up on their next sync
+        if coordinates:
+            gig_index.add(gig_id, *coordinates, gig_info(dict(airtable_data['fields'], dj_name=dj_name)))
 
         record_id = response.json().get('id')
         return jsonify({'message': 'Request created successfully', 'record_id': record_id}), 200
 
     except requests.exceptions.RequestException as e:
-        print("Airtable API error:")
-        traceback.print_exc()
+        logging.error("Airtable API error:", exc_info=True)
         return jsonify({'error': 'Airtable API error', 'details': str(e)}), 500
 
     except Exception as e:
-        print("General error:")
-        traceback.print_exc()
+        logging.error("General error:", exc_info=True)
+        return jsonify({'error': 'Internal server error', 'details': str(e)}), 500
+
+@app.route('/gigs/<path:gig_id>/qr.<fmt>', methods=['GET'])
+def gig_qr_code(gig_id, fmt):
+    if fmt not in qr_codes.QR_FORMATS:
+        return jsonify({'error': f"Unsupported format '{fmt}'"}), 404
+    size = qr_codes.nearest_size(request.args.get('size', qr_codes.QR_DEFAULT_SIZE, type=int))
+
+    try:
+        image = qr_codes.gig_image(gig_id, size, fmt)
+    except requests.exceptions.RequestException:
+        logging.error("❌ Could not load gig %s to render its QR code", gig_id, exc_info=True)
+        return jsonify({'error': 'Gig lookup failed, please retry'}), 503
+    if image is None:
+        return jsonify({'error': 'No QR code for this gig'}), 404
+    digest, body = image
+
+    response = Response(body, mimetype=qr_codes.QR_FORMATS[fmt])
+    # The image only changes if the gig is re-created with different details, which changes the digest
+    response.set_etag(f"{digest}-{size}")
+    response.cache_control.public = True
+    response.cache_control.max_age = QR_CACHE_MAX_AGE
+    return response.make_conditional(request)
+
+@app.route('/nearby-gigs', methods=['GET'])
+def nearby_gigs():
+    try:
+        lat = request.args.get('lat', type=float)
+        lon = request.args.get('lon', type=float)
+        radius_miles = request.args.get('radius_miles', default=10.0, type=float)
+        limit = request.args.get('limit', default=20, type=int)
+
+        # Accept raw coordinates, or geocode a ZIP code / city+state the same way gigs are
+        if lat is None or lon is None:
+            try:
+                lat, lon = get_coordinates(
+                    city=request.args.get('city'),
+                    state=request.args.get('state'),
+                    zip_code=request.args.get('zip_code')
+                )
+            except ValueError:
+                return jsonify({'error': 'Provide lat and lon, zip_code, or city and state'}), 400
+            except LookupError as e:
+                return jsonify({'error': str(e)}), 404
+
+        if (not all(math.isfinite(value) for value in (lat, lon, radius_miles))
+                or not (-90 <= lat <= 90 and -180 <= lon <= 180) or radius_miles <= 0 or limit <= 0):
+            return jsonify({'error': 'Invalid lat, lon, radius_miles or limit'}), 400
+
+        ensure_gig_index_fresh()
+        results = gig_index.nearby(lat, lon, min(radius_miles, 250.0), limit=min(limit, 100))
+
+        return jsonify({
+            'gigs': [dict(info, distance_miles=round(distance, 2)) for _, distance, info in results],
+            'count': len(results)
+        })
+
+    except TimeoutError as e:
+        return jsonify({'error': str(e)}), 504
+
+    except Exception as e:
+        logging.error("❌ Exception caught in /nearby-gigs", exc_info=True)
         return jsonify({'error': 'Internal server error', 'details': str(e)}), 500
 
 @app.route('/update-request-record', methods=['POST'])
 def update_request_record():
+    """
+    Attaches the guest's card to their song request. Takes the Airtable
+    record_id, or the request_id alone for requests created in async ingest
+    mode (the update is then queued behind the create and answered with 202).
+    """
     try:
         data = request.json
         record_id = data.get('record_id')
+        request_id = data.get('request_id')
         customer_id = data.get('customer_id')
         payment_method_id = data.get('payment_method_id')
 
-        if not record_id or not customer_id or not payment_method_id:
+        if not (record_id or request_id) or not customer_id or not payment_method_id:
             return jsonify({"error": "Missing required fields"}), 400
+        try:
+            attached = customer_index.payment_method_belongs_to(customer_id, payment_method_id)
+        except charge_service.stripe.error.StripeError as e:
+            logging.error("❌ Could not check payment method %s with Stripe: %s", payment_method_id, e)
+            return jsonify({"error": "Could not verify the card with Stripe, please retry"}), 503
+        if not attached:
+            return jsonify({"error": "payment_method_id is not attached to customer_id"}), 400
 
-        airtable_update_url = f"{AIRTABLE_API_URL}/{record_id}"
         payload = {
             "fields": {
                 "customer_id": customer_id,
@@ -321,37 +536,45 @@ def update_request_record():
             }
         }
 
-        response = requests.patch(airtable_update_url, json=payload, headers=HEADERS)
-        response.raise_for_status()
+        if not record_id:
+            write_behind.enqueue_update(AIRTABLE_TABLE_NAME, dict(payload['fields'], request_id=request_id))
+            customer_index.remember_payment_method(customer_id, payment_method_id, verified=True)
+            return jsonify({"message": "Update accepted", "request_id": request_id}), 202
+
+        airtable.patch(AIRTABLE_TABLE_NAME, record_id, json=payload)
+        customer_index.remember_payment_method(customer_id, payment_method_id, verified=True)
 
         return jsonify({"message": "Record updated successfully"}), 200
 
     except Exception as e:
-        traceback.print_exc()
+        logging.error("❌ Exception caught in /update-request-record", exc_info=True)
         return jsonify({"error": "Failed to update Airtable", "details": str(e)}), 500
 
 
 @app.route('/create-payment-intent', methods=['POST'])
+@admission_controlled
 def create_payment_intent():
     data = request.get_json()
     request_id = data.get('request_id')
     phone_number = data.get('phone_number')
     connected_account_id = data.get('connect_id')
+    customer_token = data.get('customer_token')
 
     if not request_id or not connected_account_id:
         return jsonify({"error": "Missing request_id or connect_id"}), 400
 
     try:
-        # Step 1: Create Stripe Customer (optional but recommended)
-        customer = stripe.Customer.create(
+        # Step 1: Reuse the guest's Stripe Customer (only with their signed customer_token), or create one
+        customer_id, _ = customer_index.resolve_customer(
+            customer_token=customer_token,
             metadata={"request_id": request_id, "phone_number": phone_number}
         )
-        
+
         # Step 2: Create the PaymentIntent for the $0.50 fee
-        payment_intent = stripe.PaymentIntent.create(
+        payment_intent = charge_service.stripe.PaymentIntent.create(
             amount=50,  # $0.50 in cents (stripe minimum)
             currency="usd",
-            customer=customer.id,
+            customer=customer_id,
             setup_future_usage="off_session",  # Allows for later charge
             metadata={"request_id": request_id},
             payment_method_configuration="pmc_1R87WWAk57lRlYLjs1ZdwkyH",
@@ -366,15 +589,16 @@ def create_payment_intent():
         return jsonify({
             "client_secret": payment_intent.client_secret,
             "payment_intent_id": payment_intent.id,
-            "customer_id": customer.id
+            "customer_id": customer_id,
+            "customer_token": customer_index.issue_customer_token(customer_id)
         })
 
     except Exception as e:
-        print("❌ Exception caught in /create-payment-intent")
-        traceback.print_exc()  #
+        logging.error("❌ Exception caught in /create-payment-intent", exc_info=True)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/lookup-dj-connect-id', methods=['POST'])
+@admission_controlled
 def lookup_dj_connect_id():
     try:
         data = request.json
@@ -383,43 +607,44 @@ def lookup_dj_connect_id():
         if not gig_id:
             return jsonify({'error': 'Missing gig_id'}), 400
 
-        # Search the gigs_tbl where gig_id matches
-        search_url = f"https://api.airtable.com/v0/{AIRTABLE_BASE_ID}/gigs_tbl"
-        headers = {
-            "Authorization": f"Bearer {AIRTABLE_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        params = {
-            "filterByFormula": f"gig_id='{gig_id}'",
-            "maxRecords": 1
-        }
-
-        response = requests.get(search_url, headers=headers, params=params)
-        response.raise_for_status()
-
-        records = response.json().get('records', [])
-        if not records:
+        # Search the gigs_tbl where gig_id matches (served from the shared gig cache when possible)
+        connect_id = fetch_connect_id(gig_id)
+        if connect_id is None:
             return jsonify({'error': 'No matching gig found'}), 404
 
-        fields = records[0]['fields']
-        connect_id = fields.get('stripe_connect_id')  # <-- assumes your Airtable has a field "stripe_connect_id"
-
         if not connect_id:
             return jsonify({'error': 'No stripe_connect_id found for gig'}), 404
 
         return jsonify({'connect_id': connect_id})
 
     except requests.exceptions.RequestException as e:
-        print("❌ Airtable API error:")
-        traceback.print_exc()
+        logging.error("❌ Airtable API error:", exc_info=True)
         return jsonify({'error': 'Airtable API error', 'details': str(e)}), 500
 
     except Exception as e:
-        print("❌ General error:")
-        traceback.print_exc()
+        logging.error("❌ General error:", exc_info=True)
         return jsonify({'error': 'Internal server error', 'details': str(e)}), 500
 
 
+# Airtable automation webhook: fired when a DJ accepts a request, so the guest is charged and texted right away
+@app.route('/notify-accepted', methods=['POST'])
+def notify_accepted():
+    if not NOTIFY_WEBHOOK_SECRET:
+        return jsonify({'error': 'Notify webhook is not configured'}), 403
+    if not hmac.compare_digest(request.headers.get('X-Webhook-Secret', ''), NOTIFY_WEBHOOK_SECRET):
+        return jsonify({'error': 'Invalid webhook secret'}), 403
+
+    data = request.get_json(silent=True) or {}
+    record_ids = data.get('record_ids') or ([data['record_id']] if data.get('record_id') else [])
+    # A bare string would otherwise be iterated into one-character "ids"
+    if (not isinstance(record_ids, list) or not record_ids
+            or not all(isinstance(record_id, str) and record_id for record_id in record_ids)):
+        return jsonify({'error': 'Missing record_id'}), 400
+
+    notify_queue.enqueue(record_ids)
+    return jsonify({'queued': len(record_ids)}), 202
+
+
 #once bid is accepted customer is charged full amount
 @app.route('/charge-customer', methods=['POST'])
 def charge_customer():
@@ -435,40 +660,132 @@ def charge_customer():
         return jsonify({'error': 'Missing data'}), 400
 
     try:
-        # Convert bid amount to cents (if it's a float/dollar value)
-        bid_amount_cents = int(round(float(bid_amount) * 100))
-
-        # Calculate 20% platform fee
-        platform_fee_cents = int(bid_amount_cents * 0.20)
-
-        # Create the off-session charge with transfer to connected account
-        payment_intent = stripe.PaymentIntent.create(
-            amount=bid_amount_cents,
-            currency='usd',
-            customer=customer_id,
-            payment_method=payment_method_id,
-            off_session=True,
-            confirm=True,
-            metadata={'request_id': request_id},
-            application_fee_amount=platform_fee_cents,
-            transfer_data={
-                'destination': connected_account_id
-            }
+        # Fee math and the PaymentIntent itself live in charge_service (shared with the scheduler)
+        payment_intent = charge_service.charge_customer(
+            customer_id=customer_id,
+            payment_method_id=payment_method_id,
+            bid_amount=bid_amount,
+            request_id=request_id,
+            connected_account_id=connected_account_id
         )
 
         return jsonify({'status': 'success', 'payment_intent': payment_intent.id})
 
-    except stripe.error.CardError as e:
-        print("❌ Exception caught in /charge-customer")
-        traceback.print_exc() 
+    except charge_service.stripe.error.CardError as e:
+        logging.error("❌ Exception caught in /charge-customer", exc_info=True)
         return jsonify({'status': 'failed', 'error': str(e)}), 402
     except Exception as e:
-        print("❌ Exception caught in /charge-customer")
-        traceback.print_exc() 
+        logging.error("❌ Exception caught in /charge-customer", exc_info=True)
         return jsonify({'status': 'failed', 'error': str(e)}), 500
 
 
 
+# Largest batch /charge-customers accepts in one call
+CHARGE_BATCH_MAX_ITEMS = 100
+
+@app.route('/charge-customers', methods=['POST'])
+@admission_controlled
+def charge_customers():
+    """
+    Bulk /charge-customer: {"charges": [{customer_id, payment_method_id,
+    bid_amount, request_id, dj_connect_id}, ...]}. Charges run concurrently
+    and each gets its own result: success, card_error, retryable (resend it
+    as-is; request_id keeps it idempotent), failed or invalid. Needs the
+    CHARGE_BATCH_TOKEN bearer token.
+    """
+    if not CHARGE_BATCH_TOKEN:
+        return jsonify({'error': 'Bulk charging is not configured'}), 403
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {CHARGE_BATCH_TOKEN}'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    charges = (request.get_json(silent=True) or {}).get('charges')
+    if not isinstance(charges, list) or not charges:
+        return jsonify({'error': 'Missing charges'}), 400
+    if len(charges) > CHARGE_BATCH_MAX_ITEMS:
+        return jsonify({'error': f'At most {CHARGE_BATCH_MAX_ITEMS} charges per batch'}), 400
+
+    results = [None] * len(charges)
+    to_charge, positions, seen = [], [], set()
+    for i, item in enumerate(charges):
+        item = item if isinstance(item, dict) else {}
+        request_id = item.get('request_id')
+        error = None
+        # request_id is required here: it's the idempotency key that makes "retryable" safe to resend
+        if not all([item.get('customer_id'), item.get('payment_method_id'), item.get('bid_amount'),
+                    request_id, item.get('dj_connect_id')]):
+            error = 'Missing data'
+        elif not isinstance(request_id, str):
+            error = 'request_id must be a string'
+            request_id = None
+        elif request_id in seen:
+            error = 'Duplicate request_id in batch'
+        else:
+            try:
+                if charge_service.to_cents(item['bid_amount']) <= 0:
+                    error = 'Invalid bid_amount'
+            except (TypeError, ValueError, OverflowError):
+                error = 'Invalid bid_amount'
+        if error:
+            results[i] = {'request_id': request_id, 'status': 'invalid', 'error': error}
+            continue
+        seen.add(request_id)
+        positions.append(i)
+        to_charge.append({
+            'customer_id': item['customer_id'],
+            'payment_method_id': item['payment_method_id'],
+            'bid_amount': item['bid_amount'],
+            'request_id': request_id,
+            'connected_account_id': item['dj_connect_id'],
+        })
+
+    try:
+        for i, result in zip(positions, charge_service.charge_many(to_charge)):
+            results[i] = result
+    except Exception as e:
+        logging.error("❌ Exception caught in /charge-customers", exc_info=True)
+        return jsonify({'status': 'failed', 'error': str(e)}), 500
+
+    summary = {}
+    for result in results:
+        summary[result['status']] = summary.get(result['status'], 0) + 1
+    logging.info("💳 Bulk charge done: %s", summary)
+    return jsonify({'results': results, 'summary': summary})
+
+
+@app.route('/settlement-report', methods=['GET'])
+def settlement_report():
+    """
+    Per-gig and per-DJ-account settlement totals (gross, platform fee,
+    transfer, refunds, in cents) for charged requests, streamed as CSV
+    (?format=csv, default) or JSON. ?gig_id= limits it to one gig;
+    ?refresh=1 recomputes closed gigs instead of using their cached rollup.
+    """
+    if not SETTLEMENT_REPORT_TOKEN:
+        return jsonify({'error': 'Settlement report is not configured'}), 403
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {SETTLEMENT_REPORT_TOKEN}'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'json'):
+        return jsonify({'error': "format must be 'csv' or 'json'"}), 400
+
+    rollups = settlement.iter_gig_rollups(request.args.get('gig_id') or None,
+                                          refresh=request.args.get('refresh') == '1')
+    # Pull the first row before answering, so Airtable or Stripe failing up front still gets a 500
+    try:
+        first = next(rollups, None)
+    except Exception as e:
+        logging.error("❌ Exception caught in /settlement-report", exc_info=True)
+        return jsonify({'error': 'Failed to build settlement report', 'details': str(e)}), 500
+    if first is not None:
+        rollups = itertools.chain([first], rollups)
+
+    if fmt == 'json':
+        return Response(stream_with_context(settlement.iter_report_json(rollups)), mimetype='application/json')
+    response = Response(stream_with_context(settlement.iter_report_csv(rollups)), mimetype='text/csv')
+    response.headers['Content-Disposition'] = 'attachment; filename="settlement-report.csv"'
+    return response
+
+
 #8080 for test bc 5000 is taken on mac
 if __name__ == "__main__":
+    start_background_services()
     app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 8080)))
@@ -0,0 +1,261 @@
+"""
+Local stand-ins for Airtable, Stripe, ClickSend and Nominatim.
+
+Each fake runs on its own loopback HTTP server with configurable latency,
+a 429 rate limit and a random failure rate, and counts every call so the
+benchmarks can report outbound traffic per scenario.
+"""
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from rate_limit import TokenBucket
+
+
+class FakeService:
+    def __init__(self, name, latency_ms=0.0, jitter_ms=0.0, rate_limit=None, failure_rate=0.0, seed=0):
+        self.name = name
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.limiter = TokenBucket(rate_limit) if rate_limit else None
+        self.calls = Counter()  # "METHOD /route" -> count
+        self.statuses = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.server = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def next_id(self, prefix):
+        return f"{prefix}{next(self._ids):06d}"
+
+    def start(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _dispatch(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                raw = self.rfile.read(length) if length else b''
+                status, body, headers = service.serve(self.command, self.path, raw, self.headers)
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = do_PATCH = do_DELETE = _dispatch
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name=f"fake-{self.name}", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def reset_counters(self):
+        with self._lock:
+            self.calls.clear()
+            self.statuses.clear()
+
+    def serve(self, method, path, raw, headers):
+        parsed = urlparse(path)
+        with self._lock:
+            self.calls[f"{method} {self.route(parsed.path)}"] += 1
+            delay = max(0.0, self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms))
+            fail = self._random.random() < self.failure_rate
+        time.sleep(delay / 1000)
+
+        if self.limiter is not None and self.limiter.try_acquire():
+            status, body, extra = 429, {'error': {'type': 'RATE_LIMIT_REACHED'}}, {'Retry-After': '1'}
+        elif fail:
+            status, body, extra = 503, {'error': {'type': 'SERVICE_UNAVAILABLE'}}, {}
+        else:
+            status, body, extra = self.handle(method, parsed.path, parse_qs(parsed.query), raw, headers)
+        with self._lock:
+            self.statuses[status] += 1
+        return status, body, extra
+
+    def route(self, path):
+        return path
+
+    def handle(self, method, path, query, raw, headers):
+        raise NotImplementedError
+
+
+class FakeAirtable(FakeService):
+    """In-memory tables with just enough filterByFormula support for this app's queries."""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('rate_limit', 5)
+        super().__init__('airtable', **kwargs)
+        self.tables = {}  # table -> {record_id: fields}
+        self._cursors = {}  # offset token -> record ids matched by the first page, like Airtable's server-side cursor
+
+    def route(self, path):
+        parts = path.strip('/').split('/')
+        return '/'.join(parts[2:3]) or path  # /v0/<base>/<table>[/<id>] -> <table>
+
+    def seed(self, table, fields_list):
+        rows = self.tables.setdefault(table, {})
+        ids = []
+        for fields in fields_list:
+            record_id = self.next_id('rec')
+            rows[record_id] = dict(fields)
+            ids.append(record_id)
+        return ids
+
+    def handle(self, method, path, query, raw, headers):
+        parts = path.strip('/').split('/')
+        table = parts[2]
+        record_id = parts[3] if len(parts) > 3 else None
+        rows = self.tables.setdefault(table, {})
+        body = json.loads(raw) if raw else {}
+
+        if method == 'GET':
+            return 200, self._list(rows, query), {}
+
+        if method == 'POST':
+            created = []
+            for item in body.get('records', [body]):
+                new_id = self.next_id('rec')
+                rows[new_id] = dict(item.get('fields', {}))
+                created.append({'id': new_id, 'fields': rows[new_id], 'createdTime': '2024-01-01T00:00:00.000Z'})
+            return 200, ({'records': created} if 'records' in body else created[0]), {}
+
+        if method == 'PATCH' and body.get('performUpsert'):
+            merge_on = body['performUpsert']['fieldsToMergeOn']
+            upserted = []
+            for item in body.get('records', []):
+                fields = item.get('fields', {})
+                key = [fields.get(name) for name in merge_on]
+                match = next((rid for rid, row in rows.items() if [row.get(name) for name in merge_on] == key), None)
+                if match is None:
+                    match = self.next_id('rec')
+                    rows[match] = {}
+                rows[match].update(fields)
+                upserted.append({'id': match, 'fields': rows[match]})
+            return 200, {'records': upserted}, {}
+
+        if method == 'PATCH':
+            items = body.get('records') or [{'id': record_id, 'fields': body.get('fields', {})}]
+            if any(item['id'] not in rows for item in items):
+                return 404, {'error': {'type': 'ROW_DOES_NOT_EXIST'}}, {}
+            updated = []
+            for item in items:
+                rows[item['id']].update(item.get('fields', {}))
+                updated.append({'id': item['id'], 'fields': rows[item['id']]})
+            return 200, ({'records': updated} if 'records' in body else updated[0]), {}
+
+        return 405, {'error': {'type': 'METHOD_NOT_ALLOWED'}}, {}
+
+    def _list(self, rows, query):
+        fields = query.get('fields[]')
+        page_size = int((query.get('pageSize') or ['100'])[0])
+        token = (query.get('offset') or [None])[0]
+        if token:
+            cursor, start = token.rsplit(':', 1)
+            matches, start = self._cursors[cursor], int(start)
+        else:
+            matches, start = self._match(rows, query), 0
+            cursor = self.next_id('itr')
+            self._cursors[cursor] = matches
+
+        records = []
+        for record_id in matches[start:start + page_size]:
+            row = rows.get(record_id, {})
+            records.append({'id': record_id,
+                            'fields': {name: row[name] for name in fields if name in row} if fields else row})
+        page = {'records': records}
+        if start + page_size < len(matches):
+            page['offset'] = f"{cursor}:{start + page_size}"
+        return page
+
+    def _match(self, rows, query):
+        formula = (query.get('filterByFormula') or [''])[0]
+        record_ids = set(re.findall(r"RECORD_ID\(\)='([^']*)'", formula))
+        gig_ids = set(re.findall(r"gig_id='([^']*)'", formula))
+        unnotified_only = '{notified}' in formula
+        # accepted_view only shows requests a DJ accepted
+        accepted_only = (query.get('view') or [''])[0] == 'accepted_view'
+
+        matches = []
+        for record_id, row in rows.items():
+            if record_ids and record_id not in record_ids:
+                continue
+            if gig_ids and row.get('gig_id') not in gig_ids:
+                continue
+            if unnotified_only and row.get('notified'):
+                continue
+            if accepted_only and not row.get('accepted'):
+                continue
+            matches.append(record_id)
+        return matches[:int((query.get('maxRecords') or [len(matches)])[0])]
+
+
+class FakeStripe(FakeService):
+    def __init__(self, decline_rate=0.0, **kwargs):
+        super().__init__('stripe', **kwargs)
+        self.decline_rate = decline_rate
+
+    def handle(self, method, path, query, raw, headers):
+        params = parse_qs(raw.decode()) if raw else {}
+        if path.startswith('/v1/customers'):
+            return 200, {'id': self.next_id('cus_'), 'object': 'customer'}, {}
+        if path.startswith('/v1/setup_intents'):
+            setup_id = self.next_id('seti_')
+            return 200, {'id': setup_id, 'object': 'setup_intent', 'client_secret': f'{setup_id}_secret'}, {}
+        if path.startswith('/v1/payment_intents'):
+            if self._random.random() < self.decline_rate:
+                return 402, {'error': {'type': 'card_error', 'code': 'card_declined',
+                                       'message': 'Your card was declined.'}}, {}
+            intent_id = self.next_id('pi_')
+            return 200, {'id': intent_id, 'object': 'payment_intent', 'status': 'succeeded',
+                         'amount': int((params.get('amount') or ['0'])[0]),
+                         'client_secret': f'{intent_id}_secret'}, {}
+        return 404, {'error': {'type': 'invalid_request_error', 'message': f'Unknown path {path}'}}, {}
+
+
+class FakeClickSend(FakeService):
+    def __init__(self, reject_rate=0.0, **kwargs):
+        super().__init__('clicksend', **kwargs)
+        self.reject_rate = reject_rate
+
+    def handle(self, method, path, query, raw, headers):
+        body = json.loads(raw) if raw else {}
+        messages = []
+        for message in body.get('messages', []):
+            status = 'INVALID_RECIPIENT' if self._random.random() < self.reject_rate else 'SUCCESS'
+            messages.append({'status': status, 'custom_string': message.get('custom_string'),
+                             'to': message.get('to'), 'message_id': self.next_id('msg')})
+        return 200, {'http_code': 200, 'response_code': 'SUCCESS', 'data': {'messages': messages}}, {}
+
+
+class FakeNominatim(FakeService):
+    def __init__(self, **kwargs):
+        super().__init__('nominatim', **kwargs)
+
+    def handle(self, method, path, query, raw, headers):
+        q = (query.get('q') or [''])[0]
+        # Deterministic pseudo-coordinates inside the continental US
+        h = sum(map(ord, q))
+        lat, lon = 25 + (h % 2300) / 100, -124 + (h * 7 % 5400) / 100
+        return 200, [{'lat': str(lat), 'lon': str(lon), 'display_name': q}], {}
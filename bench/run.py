@@ -0,0 +1,286 @@
+"""
+Offline benchmarks for the Flask endpoints and the notify pipeline.
+
+Starts local stand-ins for Airtable, Stripe, ClickSend and Nominatim (see
+bench/fakes.py), points the app at them through environment variables, then
+drives each scenario at the requested load and reports throughput,
+p50/p95/p99 latency, response codes and outbound calls per service.
+Needs no network access, so it can run in CI:
+
+    python -m bench.run --requests 300 --concurrency 8 --latency-ms 40
+    python -m bench.run --scenario check-and-notify --json --max-p95-ms 2000
+
+Exits non-zero when a scenario breaks the --max-p95-ms or --max-error-rate budget.
+"""
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.fakes import FakeAirtable, FakeClickSend, FakeNominatim, FakeStripe  # noqa: E402
+
+CITIES = [('austin', 'tx'), ('denver', 'co'), ('chicago', 'il'), ('miami', 'fl'), ('seattle', 'wa'),
+          ('nashville', 'tn'), ('portland', 'or'), ('atlanta', 'ga'), ('boston', 'ma'), ('phoenix', 'az')]
+SCENARIOS = ('song-request-sync', 'song-request-async', 'setup-intent', 'lookup-connect-id',
+             'nearby-gigs', 'check-and-notify')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                        help='scenario to run (repeatable; default: all)')
+    parser.add_argument('--requests', type=int, default=200, help='requests per HTTP scenario')
+    parser.add_argument('--concurrency', type=int, default=8, help='client threads per HTTP scenario')
+    parser.add_argument('--gigs', type=int, default=200, help='gigs seeded into the fake gigs_tbl')
+    parser.add_argument('--notify-records', type=int, default=200,
+                        help='accepted records seeded before each check_and_notify cycle')
+    parser.add_argument('--notify-cycles', type=int, default=3, help='check_and_notify cycles to time')
+    parser.add_argument('--latency-ms', type=float, default=20, help='added latency on every fake call')
+    parser.add_argument('--jitter-ms', type=float, default=5, help='+/- random jitter on that latency')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='share of fake calls answered with 503')
+    parser.add_argument('--airtable-rate-limit', type=float, default=5,
+                        help='requests/second the fake Airtable allows before answering 429')
+    parser.add_argument('--decline-rate', type=float, default=0.0, help='share of Stripe charges declined')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    parser.add_argument('--max-p95-ms', type=float, help='fail if any scenario p95 exceeds this')
+    parser.add_argument('--max-error-rate', type=float, help='fail if any scenario error share exceeds this')
+    parser.add_argument('--verbose', action='store_true', help="keep the app's logs and prints")
+    return parser.parse_args(argv)
+
+
+def start_fakes(args):
+    common = dict(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                  failure_rate=args.failure_rate, seed=args.seed)
+    return {
+        'airtable': FakeAirtable(rate_limit=args.airtable_rate_limit, **common).start(),
+        'stripe': FakeStripe(decline_rate=args.decline_rate, **common).start(),
+        'clicksend': FakeClickSend(**common).start(),
+        'nominatim': FakeNominatim(**common).start(),
+    }
+
+
+def configure_environment(fakes):
+    # Must run before the app (and its modules) are imported; they read these once
+    os.environ.update({
+        'AIRTABLE_API_KEY': 'keyBench',
+        'AIRTABLE_BASE_ID': 'appBench',
+        'AIRTABLE_API_ROOT': f"{fakes['airtable'].url}/v0",
+        'STRIPE_SECRET_KEY': 'sk_test_bench',
+        'STRIPE_PUBLISHABLE_KEY': 'pk_test_bench',
+        'STRIPE_API_BASE': fakes['stripe'].url,
+        'CLICKSEND_USERNAME': 'bench',
+        'CLICKSEND_API_KEY': 'bench',
+        'CLICKSEND_API_HOST': f"{fakes['clicksend'].url}/v3",
+        'NOMINATIM_DOMAIN': fakes['nominatim'].url.split('://', 1)[1],
+        'NOMINATIM_SCHEME': 'http',
+        'NOMINATIM_RATE_LIMIT': '1000',
+        'STATE_DIR': tempfile.mkdtemp(prefix='nxtsong-bench-'),
+        # The benchmark drives check_and_notify itself
+        'NOTIFY_POLL_INTERVAL_MINUTES': '1440',
+    })
+
+
+def seed_gigs(airtable, count):
+    gigs = []
+    for i in range(count):
+        city, state = CITIES[i % len(CITIES)]
+        gigs.append({'gig_id': f'gig-{i}', 'venue': f'Venue {i}', 'city': city, 'state': state,
+                     'dj_name': f'DJ {i}', 'stripe_connect_id': f'acct_bench{i:04d}'})
+    airtable.seed('gigs_tbl', gigs)
+    return [gig['gig_id'] for gig in gigs]
+
+
+def seed_accepted(airtable, count, gig_ids, offset):
+    airtable.seed('song_requests_tbl', [{
+        'request_id': f'req-n{offset + i}',
+        'gig_id': gig_ids[i % len(gig_ids)],
+        'song_name': f'Song {offset + i}',
+        'phone_number': f'+1555{(offset + i) % 10_000_000:07d}',
+        'customer_id': f'cus_bench{i}',
+        'payment_method_id': f'pm_bench{i}',
+        'bid_amount': 5 + i % 20,
+        'accepted': True,
+        'notified': False,
+    } for i in range(count)])
+
+
+def summarize(name, latencies, statuses, elapsed, fakes, units=None):
+    latencies_ms = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+    units = units if units is not None else len(latencies)
+    errors = sum(count for status, count in statuses.items() if status >= 500)
+    return {
+        'scenario': name,
+        'count': units,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_per_s': round(units / elapsed, 1) if elapsed else None,
+        'p50_ms': round(float(p50), 2),
+        'p95_ms': round(float(p95), 2),
+        'p99_ms': round(float(p99), 2),
+        'error_rate': round(errors / max(1, sum(statuses.values())), 4),
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'outbound': {service: dict(fake.calls) for service, fake in fakes.items() if fake.calls},
+        'outbound_statuses': {service: {str(s): c for s, c in sorted(fake.statuses.items())}
+                              for service, fake in fakes.items() if fake.statuses},
+    }
+
+
+def run_http(app, name, total, concurrency, build, fakes, settle=None):
+    """Sends `total` requests from `concurrency` threads; build(i) returns (method, path, json)."""
+    for fake in fakes.values():
+        fake.reset_counters()
+    counter = itertools.count()
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+
+    def worker():
+        client = app.test_client()
+        while True:
+            i = next(counter)
+            if i >= total:
+                return
+            method, path, payload = build(i)
+            started = time.perf_counter()
+            response = client.open(path, method=method, json=payload)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(max(1, concurrency))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    if settle:
+        settle()
+    return summarize(name, latencies, statuses, elapsed, fakes)
+
+
+def wait_for_rows(fake_airtable, table, count, timeout=30):
+    deadline = time.monotonic() + timeout
+    while len(fake_airtable.tables.get(table, {})) < count and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+
+def run_scenarios(args, fakes):
+    import app as app_module
+    import airtable_utils
+
+    app = app_module.app
+    airtable = fakes['airtable']
+    gig_ids = seed_gigs(airtable, args.gigs)
+    scenarios = args.scenario or list(SCENARIOS)
+    results = []
+
+    def song_request(i):
+        return 'POST', '/create-song-request-record', {
+            'request_id': f'req-{time.monotonic_ns()}-{i}', 'gig_id': gig_ids[i % len(gig_ids)],
+            'song_name': f'Song {i}', 'artist_name': 'Artist', 'bid_amount': 5 + i % 20,
+            'phone_number': f'+1555{i:07d}', 'requestor_name': 'Guest'}
+
+    for name in scenarios:
+        if name in ('song-request-sync', 'song-request-async'):
+            app_module.SONG_REQUEST_INGEST_MODE = name.rsplit('-', 1)[1]
+            expected = len(airtable.tables.get('song_requests_tbl', {})) + args.requests
+            settle = (lambda: wait_for_rows(airtable, 'song_requests_tbl', expected)) if name.endswith('async') else None
+            results.append(run_http(app, name, args.requests, args.concurrency, song_request, fakes, settle))
+
+        elif name == 'setup-intent':
+            expected = len(airtable.tables.get('customers_tbl', {})) + args.requests
+            results.append(run_http(app, name, args.requests, args.concurrency, lambda i: (
+                'POST', '/create-setup-intent', {'customer_name': f'Guest {i}', 'email': f'guest{i}@example.com',
+                                                 'phone_number': f'+1555{i:07d}', 'offer_id': f'offer-{i}'}),
+                fakes, settle=lambda: wait_for_rows(airtable, 'customers_tbl', expected)))
+
+        elif name == 'lookup-connect-id':
+            # Mostly repeat gigs (cache hits) with a tail of cold ones
+            hot = gig_ids[:max(1, len(gig_ids) // 10)]
+            results.append(run_http(app, name, args.requests, args.concurrency, lambda i: (
+                'POST', '/lookup-dj-connect-id',
+                {'gig_id': gig_ids[(i * 7) % len(gig_ids)] if i % 5 == 0 else hot[i % len(hot)]}), fakes))
+
+        elif name == 'nearby-gigs':
+            results.append(run_http(app, name, args.requests, args.concurrency, lambda i: (
+                'GET', f'/nearby-gigs?zip_code={10000 + (i * 37) % 500}&radius_miles=250', None), fakes))
+
+        elif name == 'check-and-notify':
+            for fake in fakes.values():
+                fake.reset_counters()
+            durations, total_elapsed = [], 0.0
+            for cycle in range(args.notify_cycles):
+                seed_accepted(airtable, args.notify_records, gig_ids, cycle * args.notify_records)
+                started = time.perf_counter()
+                airtable_utils.check_and_notify()
+                durations.append(time.perf_counter() - started)
+                total_elapsed += durations[-1]
+            records = args.notify_cycles * args.notify_records
+            results.append(summarize(name, durations, {200: len(durations)}, total_elapsed, fakes, units=records))
+
+    return results
+
+
+def print_report(results):
+    for result in results:
+        print(f"\n== {result['scenario']}: {result['count']} in {result['elapsed_s']}s "
+              f"({result['throughput_per_s']}/s)")
+        print(f"   p50 {result['p50_ms']}ms  p95 {result['p95_ms']}ms  p99 {result['p99_ms']}ms  "
+              f"errors {result['error_rate']:.2%}  statuses {result['statuses']}")
+        for service, calls in result['outbound'].items():
+            summary = ", ".join(f"{route} x{count}" for route, count in sorted(calls.items()))
+            print(f"   {service}: {summary}  {result['outbound_statuses'].get(service, {})}")
+
+
+def check_budgets(args, results):
+    failures = []
+    for result in results:
+        if args.max_p95_ms is not None and result['p95_ms'] > args.max_p95_ms:
+            failures.append(f"{result['scenario']}: p95 {result['p95_ms']}ms > {args.max_p95_ms}ms")
+        if args.max_error_rate is not None and result['error_rate'] > args.max_error_rate:
+            failures.append(f"{result['scenario']}: error rate {result['error_rate']} > {args.max_error_rate}")
+    return failures
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    fakes = start_fakes(args)
+    configure_environment(fakes)
+
+    try:
+        if args.verbose:
+            results = run_scenarios(args, fakes)
+        else:
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), \
+                    contextlib.redirect_stderr(devnull):
+                import logging
+                logging.disable(logging.CRITICAL)
+                results = run_scenarios(args, fakes)
+    finally:
+        for fake in fakes.values():
+            fake.stop()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
+
+    failures = check_budgets(args, results)
+    for failure in failures:
+        print(f"BUDGET EXCEEDED {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,154 @@
+"""
+Worker boot benchmark: how long `import app` takes in a fresh interpreter,
+which top-level imports dominate it, and how long a gunicorn worker takes
+from spawn to its first HTTP response. Outbound services point at the local
+fakes, so nothing leaves the machine:
+
+    python -m bench.startup --runs 5
+    python -m bench.startup --json --max-import-ms 800 --max-first-response-ms 2500
+
+Exits non-zero when a median breaks its budget.
+"""
+import argparse
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.fakes import FakeAirtable  # noqa: E402
+
+_IMPORT_SNIPPET = "import time; t = time.perf_counter(); import app; print(time.perf_counter() - t)"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3, help='fresh interpreters / workers to time')
+    parser.add_argument('--top', type=int, default=10, help='slowest top-level imports to list')
+    parser.add_argument('--skip-gunicorn', action='store_true', help='only time the import')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    parser.add_argument('--max-import-ms', type=float, help='fail if the median import time exceeds this')
+    parser.add_argument('--max-first-response-ms', type=float,
+                        help='fail if the median spawn-to-first-response time exceeds this')
+    return parser.parse_args(argv)
+
+
+def bench_env(airtable):
+    env = dict(os.environ)
+    env.update({
+        'AIRTABLE_API_KEY': 'keyBench',
+        'AIRTABLE_BASE_ID': 'appBench',
+        'AIRTABLE_API_ROOT': f"{airtable.url}/v0",
+        'STRIPE_SECRET_KEY': 'sk_test_bench',
+        'STATE_DIR': tempfile.mkdtemp(prefix='nxtsong-startup-'),
+        'NOTIFY_POLL_INTERVAL_MINUTES': '1440',
+        'LOG_LEVEL': 'WARNING',
+    })
+    return env
+
+
+def time_import(env):
+    out = subprocess.run([sys.executable, '-c', _IMPORT_SNIPPET], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    return float(out.strip().splitlines()[-1]) * 1000
+
+
+def slowest_imports(env, top):
+    """Cumulative time of the modules app.py imports directly, from `python -X importtime`."""
+    err = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True).stderr
+    # Children are listed (one level deeper) before their parent, so collect depth-1 lines until `app` closes them
+    children, modules = [], []
+    for line in err.splitlines():
+        match = re.match(r'import time:\s+\d+ \|\s+(\d+) \| ( *)(\S+)$', line)
+        if not match:
+            continue
+        depth, name, cumulative_ms = len(match.group(2)) // 2, match.group(3), int(match.group(1)) / 1000
+        if depth == 1:
+            children.append((name, cumulative_ms))
+        elif depth == 0:
+            if name == 'app':
+                modules = children
+            children = []
+    return sorted(modules, key=lambda item: item[1], reverse=True)[:top]
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def time_first_response(env, timeout=30):
+    port = _free_port()
+    started = time.perf_counter()
+    worker = subprocess.Popen([sys.executable, '-m', 'gunicorn', 'app:app', '--workers', '1',
+                               '--bind', f'127.0.0.1:{port}'],
+                              cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = started + timeout
+        while time.perf_counter() < deadline:
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=1) as response:
+                    if response.status == 200:
+                        return (time.perf_counter() - started) * 1000
+            except OSError:
+                time.sleep(0.01)
+        raise TimeoutError(f"gunicorn did not answer within {timeout}s")
+    finally:
+        worker.terminate()
+        worker.wait(timeout=10)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    airtable = FakeAirtable(rate_limit=None).start()
+    env = bench_env(airtable)
+
+    try:
+        # One throwaway import so .pyc compilation doesn't count against the first run
+        time_import(env)
+        imports = [time_import(env) for _ in range(args.runs)]
+        first_responses = [] if args.skip_gunicorn else [time_first_response(env) for _ in range(args.runs)]
+        slowest = slowest_imports(env, args.top)
+    finally:
+        airtable.stop()
+
+    report = {
+        'import_ms': {'median': round(statistics.median(imports), 1), 'runs': [round(v, 1) for v in imports]},
+        'slowest_imports_ms': {name: round(ms, 1) for name, ms in slowest},
+    }
+    if first_responses:
+        report['first_response_ms'] = {'median': round(statistics.median(first_responses), 1),
+                                       'runs': [round(v, 1) for v in first_responses]}
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"import app: median {report['import_ms']['median']}ms over {args.runs} run(s)")
+        for name, ms in report['slowest_imports_ms'].items():
+            print(f"   {name:<24} {ms:>8.1f}ms")
+        if first_responses:
+            print(f"gunicorn spawn -> first response: median {report['first_response_ms']['median']}ms")
+
+    failures = []
+    if args.max_import_ms is not None and report['import_ms']['median'] > args.max_import_ms:
+        failures.append(f"import {report['import_ms']['median']}ms > {args.max_import_ms}ms")
+    if (args.max_first_response_ms is not None and first_responses
+            and report['first_response_ms']['median'] > args.max_first_response_ms):
+        failures.append(f"first response {report['first_response_ms']['median']}ms > {args.max_first_response_ms}ms")
+    for failure in failures:
+        print(f"BUDGET EXCEEDED {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""
+Builds the offline geocoding table from the Census Bureau gazetteer files:
+one row per ZIP code tabulation area and one per "city, st" place, each at
+its internal point. It runs in the deploy build step (render.yaml's
+buildCommand), after installing the requirements, so every instance starts
+with the full table on disk:
+
+    pip install -r requirements.txt && python build_centroids.py
+
+geocode.py reads the output (GEOCODE_GAZETTEER_PATH) under the hand-curated
+rows in data/us_centroids.csv, and only falls back to Nominatim for places
+neither table knows.
+"""
+import argparse
+import csv
+import io
+import os
+import re
+import sys
+import zipfile
+
+import requests
+
+from geocode import GAZETTEER_PATH
+
+GAZETTEER_YEAR = os.getenv("GAZETTEER_YEAR", "2023")
+GAZETTEER_URL = "https://www2.census.gov/geo/docs/maps-data/data/gazetteer/{year}_Gazetteer/{year}_Gaz_{kind}_national.zip"
+
+# Legal/statistical area descriptions the places file appends to names ("Austin city", "Boulder CDP")
+_PLACE_SUFFIX = re.compile(
+    r"\s+(city|town|village|borough|township|municipality|CDP|comunidad|zona urbana|"
+    r"city and borough|consolidated government|metropolitan government|unified government|"
+    r"urban county|corporation|plantation)(\s+\(balance\))?$|\s+\(balance\)$",
+    re.IGNORECASE
+)
+
+
+def _rows(kind, year):
+    response = requests.get(GAZETTEER_URL.format(year=year, kind=kind), timeout=120)
+    response.raise_for_status()
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        name = next(name for name in archive.namelist() if name.endswith('.txt'))
+        text = archive.read(name).decode('utf-8')
+    reader = csv.reader(io.StringIO(text), delimiter='\t')
+    # The last header column carries trailing spaces
+    header = [column.strip() for column in next(reader)]
+    for row in reader:
+        yield dict(zip(header, (value.strip() for value in row)))
+
+
+def place_query(name, state):
+    # "Nashville-Davidson metropolitan government (balance)", "TN" -> "nashville-davidson, tn"
+    return f"{_PLACE_SUFFIX.sub('', name).strip().lower()}, {state.strip().lower()}"
+
+
+def zcta_centroids(rows):
+    for row in rows:
+        yield row['GEOID'], float(row['INTPTLAT']), float(row['INTPTLONG'])
+
+
+def place_centroids(rows):
+    # A city and a CDP can share a name within a state; the larger one wins
+    best = {}
+    for row in rows:
+        query = place_query(row['NAME'], row['USPS'])
+        area = float(row.get('ALAND_SQMI') or 0)
+        if query not in best or area > best[query][0]:
+            best[query] = (area, float(row['INTPTLAT']), float(row['INTPTLONG']))
+    for query, (_, lat, lon) in best.items():
+        yield query, lat, lon
+
+
+def build(path=GAZETTEER_PATH, year=GAZETTEER_YEAR):
+    tmp_path = f"{path}.tmp"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    count = 0
+    with open(tmp_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(('query', 'latitude', 'longitude'))
+        for query, lat, lon in zcta_centroids(_rows('zcta', year)):
+            writer.writerow((query, f"{lat:.6f}", f"{lon:.6f}"))
+            count += 1
+        for query, lat, lon in place_centroids(_rows('place', year)):
+            writer.writerow((query, f"{lat:.6f}", f"{lon:.6f}"))
+            count += 1
+    # Swap in atomically so a running worker never reads a half-written table
+    os.replace(tmp_path, path)
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', default=GAZETTEER_PATH, help='where to write the centroid CSV')
+    parser.add_argument('--year', default=GAZETTEER_YEAR, help='gazetteer vintage to download')
+    args = parser.parse_args(argv)
+    count = build(args.output, args.year)
+    print(f"Wrote {count} centroids to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import metrics
+from airtable_client import formula_string
+from rate_limit import TokenBucket
+
+_stripe = None
+_stripe_lock = threading.Lock()
+
+
+def _stripe_operation(method, url):
+    # "/v1/payment_intents/pi_123/confirm" -> "POST /v1/payment_intents", so ids don't explode label sets
+    return f"{method.upper()} {'/'.join(urlsplit(url).path.split('/')[:3])}"
+
+
+def _instrumented_client(stripe):
+    class InstrumentedStripeClient(stripe.RequestsClient):
+        """Stripe's default HTTP client, recording every attempt in the outbound metrics."""
+
+        def __init__(self, **kwargs):
+            super().__init__(**kwargs)
+            self._local = threading.local()
+
+        def request(self, method, url, headers, post_data=None):
+            operation = self._local.operation = _stripe_operation(method, url)
+            started = time.perf_counter()
+            status = 'error'
+            try:
+                content, status, response_headers = super().request(method, url, headers, post_data)
+                return content, status, response_headers
+            finally:
+                metrics.outbound_latency.observe(time.perf_counter() - started, service='stripe', operation=operation)
+                metrics.outbound_requests.inc(service='stripe', operation=operation, status=status)
+
+        def _should_retry(self, response, api_connection_error, num_retries, max_network_retries):
+            retry = super()._should_retry(response, api_connection_error, num_retries, max_network_retries)
+            if retry:
+                metrics.outbound_retries.inc(service='stripe', operation=getattr(self._local, 'operation', ''))
+            return retry
+
+    return InstrumentedStripeClient()
+
+
+def load_stripe():
+    """
+    Imports and configures the Stripe SDK on first use. The import alone
+    takes over a second, so it stays off the worker boot path; callers use
+    `charge_service.stripe`, which resolves through this.
+    """
+    global _stripe
+    if _stripe is None:
+        with _stripe_lock:
+            if _stripe is None:
+                import stripe
+                # Stripe Secret Key from environment variable
+                stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+                # Lets the offline benchmarks point Stripe at a local stand-in
+                if os.getenv("STRIPE_API_BASE"):
+                    stripe.api_base = os.getenv("STRIPE_API_BASE")
+                stripe.default_http_client = _instrumented_client(stripe)
+                _stripe = stripe
+    return _stripe
+
+
+def __getattr__(name):
+    # Module-level lazy attribute: `charge_service.stripe` imports the SDK on first access
+    if name == 'stripe':
+        return load_stripe()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Share of every bid kept by the platform; the rest is transferred to the DJ
+PLATFORM_FEE_RATE = 0.20
+
+# Bulk charges: parallel Stripe calls per batch, and request rates kept under Stripe's limits
+# (25/s in test mode, 100/s live) overall and per connected account
+CHARGE_BATCH_MAX_WORKERS = int(os.getenv("CHARGE_BATCH_MAX_WORKERS", "8"))
+STRIPE_RATE_PER_SECOND = float(os.getenv("STRIPE_RATE_PER_SECOND", "20"))
+CHARGE_ACCOUNT_RATE_PER_SECOND = float(os.getenv("CHARGE_ACCOUNT_RATE_PER_SECOND", "5"))
+
+# Per-item outcomes of charge_many
+CHARGE_SUCCEEDED = 'success'
+CHARGE_CARD_ERROR = 'card_error'
+CHARGE_RETRYABLE = 'retryable'
+CHARGE_FAILED = 'failed'
+
+_platform_bucket = TokenBucket(STRIPE_RATE_PER_SECOND)
+_account_buckets = {}
+_account_buckets_lock = threading.Lock()
+
+
+def to_cents(amount):
+    """Converts a dollar amount (float, int or numeric string) to integer cents."""
+    return int(round(float(amount) * 100))
+
+
+def platform_fee_cents(amount_cents):
+    return int(amount_cents * PLATFORM_FEE_RATE)
+
+
+def charge_idempotency_key(request_id):
+    # One key per request, card or not: it is what stops a second charge when the local outbox row is gone
+    return f"charge-{request_id}"
+
+
+def find_bid_charge(request_id):
+    """
+    Returns the PaymentIntent that already charged this request's bid (not
+    its $0.50 request fee, which carries no application fee), or None.
+    """
+    query = f"metadata['request_id']:{formula_string(request_id)}"
+    for intent in load_stripe().PaymentIntent.search(query=query, limit=10).auto_paging_iter():
+        if intent.application_fee_amount is not None and intent.status in ('succeeded', 'processing'):
+            return intent
+    return None
+
+
+def charge_customer(customer_id, payment_method_id, bid_amount, request_id, connected_account_id):
+    """
+    Charges a saved card off-session for an accepted bid and routes the
+    payout to the DJ's connected account, keeping the platform fee.
+    Returns the confirmed PaymentIntent; Stripe errors propagate to the caller.
+
+    The Stripe call carries an idempotency key derived from `request_id`, so
+    retrying the same request returns the original PaymentIntent instead of
+    charging the card again. If the request was already charged with other
+    parameters (say, a different card), that earlier PaymentIntent is
+    returned rather than a second charge.
+    """
+    stripe = load_stripe()
+    # Convert bid amount to cents (if it's a float/dollar value)
+    bid_amount_cents = to_cents(bid_amount)
+    options = {'idempotency_key': charge_idempotency_key(request_id)} if request_id else {}
+
+    # Create the off-session charge with transfer to connected account
+    try:
+        return stripe.PaymentIntent.create(
+            amount=bid_amount_cents,
+            currency='usd',
+            customer=customer_id,
+            payment_method=payment_method_id,
+            off_session=True,
+            confirm=True,
+            metadata={'request_id': request_id},
+            application_fee_amount=platform_fee_cents(bid_amount_cents),
+            transfer_data={
+                'destination': connected_account_id
+            },
+            **options
+        )
+    except stripe.error.IdempotencyError:
+        existing = find_bid_charge(request_id) if request_id else None
+        if existing is None:
+            raise
+        logging.info(f"Request {request_id} was already charged ({existing.id}); not charging it again.")
+        return existing
+
+
+def _account_bucket(connected_account_id):
+    with _account_buckets_lock:
+        bucket = _account_buckets.get(connected_account_id)
+        if bucket is None:
+            bucket = _account_buckets[connected_account_id] = TokenBucket(CHARGE_ACCOUNT_RATE_PER_SECOND)
+        return bucket
+
+
+def classify_charge_error(e):
+    """
+    Maps a charge exception to CHARGE_CARD_ERROR (the card was declined; ask
+    for another), CHARGE_RETRYABLE (rate limit, network or Stripe-side
+    failure; safe to resend with the same request_id) or CHARGE_FAILED.
+    An IdempotencyError that charge_customer couldn't match to an earlier
+    charge would fail the same way on every resend, so it counts as failed.
+    """
+    stripe = load_stripe()
+    if isinstance(e, stripe.error.CardError):
+        return CHARGE_CARD_ERROR
+    if isinstance(e, stripe.error.IdempotencyError):
+        return CHARGE_FAILED
+    if isinstance(e, (stripe.error.RateLimitError, stripe.error.APIConnectionError)):
+        return CHARGE_RETRYABLE
+    if isinstance(e, stripe.error.StripeError) and (e.http_status or 500) >= 500:
+        return CHARGE_RETRYABLE
+    return CHARGE_FAILED
+
+
+def _charge_one(charge):
+    connected_account_id = charge['connected_account_id']
+    _account_bucket(connected_account_id).acquire()
+    _platform_bucket.acquire()
+    try:
+        payment_intent = charge_customer(**charge)
+        return {'request_id': charge['request_id'], 'status': CHARGE_SUCCEEDED, 'payment_intent': payment_intent.id}
+    except Exception as e:
+        result = {'request_id': charge['request_id'], 'status': classify_charge_error(e), 'error': str(e)}
+        if result['status'] == CHARGE_CARD_ERROR:
+            result['code'] = e.code
+            result['decline_code'] = getattr(e.error, 'decline_code', None) if e.error else None
+        else:
+            logging.warning(f"Charge for request {charge['request_id']} failed ({result['status']}): {e}")
+        return result
+
+
+def charge_many(charges, max_workers=CHARGE_BATCH_MAX_WORKERS):
+    """
+    Runs charge_customer for each dict of its keyword arguments on a bounded
+    thread pool, throttled per connected account and overall. Returns one
+    result per charge, in order; a failed charge never stops the rest.
+    """
+    if not charges:
+        return []
+    load_stripe()
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(charges))),
+                            thread_name_prefix="charge") as pool:
+        return list(pool.map(_charge_one, charges))
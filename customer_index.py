@@ -0,0 +1,102 @@
+import hashlib
+import hmac
+import os
+import time
+
+import charge_service
+import local_db
+
+# Signs the customer session tokens handed to guests; without it every request gets a new customer
+CUSTOMER_SESSION_SECRET = os.getenv("CUSTOMER_SESSION_SECRET")
+CUSTOMER_SESSION_TTL_SECONDS = int(os.getenv("CUSTOMER_SESSION_TTL_SECONDS", str(90 * 24 * 3600)))
+
+
+def _schema(conn):
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS payment_methods ("
+        " stripe_id TEXT PRIMARY KEY, payment_method_id TEXT NOT NULL, updated_at REAL NOT NULL)"
+    )
+
+
+_db = local_db.LocalDB("customer_index", _schema)
+
+
+def payment_method_belongs_to(stripe_id, payment_method_id):
+    """
+    Asks Stripe whether the card is attached to this customer; client-supplied
+    pairs are never trusted. Errors other than an unknown card (Stripe
+    unreachable, rate limited) are raised as StripeError.
+    """
+    stripe = charge_service.stripe
+    try:
+        payment_method = stripe.PaymentMethod.retrieve(payment_method_id)
+    except stripe.error.InvalidRequestError:
+        return False
+    customer = payment_method.customer
+    return (customer if isinstance(customer, str) or customer is None else customer.id) == stripe_id
+
+
+def remember_payment_method(stripe_id, payment_method_id, verified=False):
+    """
+    Records the guest's card for reuse once Stripe confirms it is attached to
+    `stripe_id`; pass `verified` if the caller already checked that.
+    """
+    if not stripe_id or not payment_method_id:
+        return False
+    if not verified and not payment_method_belongs_to(stripe_id, payment_method_id):
+        return False
+    with _db as conn:
+        conn.execute("INSERT OR REPLACE INTO payment_methods VALUES (?, ?, ?)",
+                     (stripe_id, payment_method_id, time.time()))
+    return True
+
+
+def saved_payment_method(stripe_id):
+    with _db as conn:
+        row = conn.execute("SELECT payment_method_id FROM payment_methods WHERE stripe_id = ?",
+                           (stripe_id,)).fetchone()
+    return row[0] if row else None
+
+
+def _sign(payload):
+    return hmac.new(CUSTOMER_SESSION_SECRET.encode(), payload.encode(), hashlib.sha256).hexdigest()
+
+
+def issue_customer_token(stripe_id):
+    """
+    Returns a signed session token for a guest's own Stripe customer (None
+    when CUSTOMER_SESSION_SECRET is unset). Presenting it later is what lets
+    the guest reuse that customer.
+    """
+    if not CUSTOMER_SESSION_SECRET or not stripe_id:
+        return None
+    payload = f"{stripe_id}.{int(time.time()) + CUSTOMER_SESSION_TTL_SECONDS}"
+    return f"{payload}.{_sign(payload)}"
+
+
+def verify_customer_token(token):
+    """Returns the Stripe customer id a valid, unexpired token was issued for, else None."""
+    if not CUSTOMER_SESSION_SECRET or not isinstance(token, str) or token.count('.') != 2:
+        return None
+    payload, signature = token.rsplit('.', 1)
+    if not hmac.compare_digest(signature, _sign(payload)):
+        return None
+    stripe_id, expires = payload.split('.')
+    if not expires.isdigit() or int(expires) < time.time():
+        return None
+    return stripe_id
+
+
+def resolve_customer(customer_token=None, **create_params):
+    """
+    Returns (customer_id, created): the guest's existing Stripe customer when
+    they present a valid session token from issue_customer_token(), otherwise
+    a new one created with `create_params`.
+
+    Email and phone are never verified, so matching on them alone must not
+    hand out another guest's customer (and with it their saved cards).
+    """
+    customer_id = verify_customer_token(customer_token)
+    if customer_id:
+        return customer_id, False
+    return charge_service.stripe.Customer.create(**create_params).id, True
@@ -0,0 +1,146 @@
+import csv
+import logging
+import os
+import threading
+import time
+
+import local_db
+import metrics
+from rate_limit import TokenBucket
+
+_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+# Hand-curated ZIP-code and "city, st" centroids, checked before Nominatim; these win over the gazetteer
+CENTROIDS_PATH = os.getenv("GEOCODE_CENTROIDS_PATH", os.path.join(_DATA_DIR, "us_centroids.csv"))
+# Every Census ZCTA and place, generated at build time by build_centroids.py
+GAZETTEER_PATH = os.getenv("GEOCODE_GAZETTEER_PATH", os.path.join(_DATA_DIR, "us_gazetteer_centroids.csv"))
+GEOCODE_CACHE_MAX_ENTRIES = int(os.getenv("GEOCODE_CACHE_MAX_ENTRIES", "20000"))
+GEOCODE_TIMEOUT = float(os.getenv("GEOCODE_TIMEOUT_SECONDS", "10"))
+
+# Nominatim's public usage policy allows at most 1 request per second
+nominatim_limiter = TokenBucket(float(os.getenv("NOMINATIM_RATE_LIMIT", "1")))
+
+_geolocator = None
+_geolocator_lock = threading.Lock()
+_centroids = None
+_centroids_lock = threading.Lock()
+
+
+def get_geolocator():
+    # geopy is only imported once a lookup actually misses the offline table and the cache
+    global _geolocator
+    with _geolocator_lock:
+        if _geolocator is None:
+            from geopy.geocoders import Nominatim
+            _geolocator = Nominatim(
+                user_agent="dj_locator",
+                domain=os.getenv("NOMINATIM_DOMAIN", "nominatim.openstreetmap.org"),
+                scheme=os.getenv("NOMINATIM_SCHEME", "https")
+            )
+        return _geolocator
+
+
+def normalize_query(city=None, state=None, zip_code=None):
+    if zip_code:
+        return str(zip_code).strip()[:5]
+    if city and state:
+        return f"{city.strip().lower()}, {state.strip().lower()}"
+    raise ValueError("Either ZIP code or both city and state must be provided.")
+
+
+def _read_centroids(path, table):
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            table[row['query'].strip().lower()] = (float(row['latitude']), float(row['longitude']))
+
+
+def load_centroids():
+    """
+    Reads the offline centroid tables once per process. The app calls it at
+    startup, so a deploy missing the gazetteer table is reported right away
+    instead of quietly sending every ZIP lookup to Nominatim.
+    """
+    global _centroids
+    with _centroids_lock:
+        if _centroids is None:
+            table = {}
+            try:
+                _read_centroids(GAZETTEER_PATH, table)
+            except FileNotFoundError:
+                logging.error(f"Gazetteer centroid table not found at {GAZETTEER_PATH}; ZIP and most city lookups "
+                              "will go to Nominatim. Run build_centroids.py in the build step.")
+            try:
+                _read_centroids(CENTROIDS_PATH, table)
+            except FileNotFoundError:
+                logging.error(f"Geocode centroid table not found at {CENTROIDS_PATH}.")
+            _centroids = table
+        return _centroids
+
+
+def _schema(conn):
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS geocode_cache ("
+        " query TEXT PRIMARY KEY, latitude REAL NOT NULL, longitude REAL NOT NULL, last_used REAL NOT NULL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS geocode_cache_last_used ON geocode_cache (last_used)")
+
+
+_cache = local_db.LocalDB("geocode_cache", _schema)
+
+
+def _cache_get(query):
+    with _cache as conn:
+        row = conn.execute("SELECT latitude, longitude FROM geocode_cache WHERE query = ?", (query,)).fetchone()
+        if row:
+            conn.execute("UPDATE geocode_cache SET last_used = ? WHERE query = ?", (time.time(), query))
+        return tuple(row) if row else None
+
+
+def _cache_put(query, coordinates):
+    with _cache as conn:
+        conn.execute("INSERT OR REPLACE INTO geocode_cache VALUES (?, ?, ?, ?)",
+                     (query, coordinates[0], coordinates[1], time.time()))
+        # Evict least recently used entries past the size bound
+        conn.execute(
+            "DELETE FROM geocode_cache WHERE query IN ("
+            " SELECT query FROM geocode_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (GEOCODE_CACHE_MAX_ENTRIES,)
+        )
+
+
+#GEOCODE ZIP CODE OR CITY,STATE IN ORDER TO GET COORDINATES
+def get_coordinates(city=None, state=None, zip_code=None):
+    """
+    Resolves a ZIP code or city/state to (latitude, longitude), checking the
+    offline centroid table, then the on-disk cache, then Nominatim.
+    """
+    query = normalize_query(city, state, zip_code)
+
+    coordinates = load_centroids().get(query)
+    if coordinates:
+        return coordinates
+
+    try:
+        coordinates = _cache_get(query)
+    except Exception as e:
+        logging.warning(f"Geocode cache read failed for {query}: {e}")
+    if coordinates:
+        return coordinates
+
+    geolocator = get_geolocator()
+    from geopy.exc import GeocoderTimedOut
+    try:
+        nominatim_limiter.acquire()
+        with metrics.track_call('nominatim', 'GET /search'):
+            location = geolocator.geocode(query, timeout=GEOCODE_TIMEOUT)
+    except GeocoderTimedOut:
+        raise TimeoutError("Geocoding service timed out. Please try again.")
+
+    if not location:
+        raise LookupError(f"Could not find coordinates for: {query}")
+
+    coordinates = (location.latitude, location.longitude)
+    try:
+        _cache_put(query, coordinates)
+    except Exception as e:
+        logging.warning(f"Geocode cache write failed for {query}: {e}")
+    return coordinates
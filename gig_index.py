@@ -0,0 +1,267 @@
+import logging
+import math
+import os
+import threading
+import time
+
+import numpy as np
+import requests
+from haversine import Unit, haversine_vector
+
+from airtable_batch import batch_writer
+from airtable_client import airtable, is_unknown_field_error, utc_iso, AIRTABLE_CURSOR_OVERLAP_SECONDS
+from geocode import get_coordinates
+
+GIGS_TABLE_NAME = 'gigs_tbl'
+GIG_FIELDS = ('gig_id', 'dj_name', 'venue', 'city', 'state')
+# Number fields on gigs_tbl holding the coordinates create_gig geocoded, so no later sync has to
+GIG_COORDINATE_FIELDS = ('latitude', 'longitude')
+
+# Grid cell edge in degrees (~35 miles of latitude); queries only scan cells overlapping the radius
+GIG_INDEX_CELL_DEGREES = float(os.getenv("GIG_INDEX_CELL_DEGREES", "0.5"))
+# How often each worker pulls gigs created elsewhere (other workers, Airtable UI) into its index
+GIG_INDEX_REFRESH_SECONDS = int(os.getenv("GIG_INDEX_REFRESH_SECONDS", "300"))
+# Incremental syncs only see added or edited gigs; a periodic full reload also drops deleted ones
+GIG_INDEX_FULL_SYNC_SECONDS = int(os.getenv("GIG_INDEX_FULL_SYNC_SECONDS", "3600"))
+
+_MILES_PER_DEGREE_LAT = 69.0
+
+
+class _Cell:
+    __slots__ = ('gigs', '_ids', '_coords')
+
+    def __init__(self):
+        self.gigs = {}  # gig_id -> (lat, lon)
+        self._ids = None
+        self._coords = None
+
+    def arrays(self):
+        # Packed (ids, Nx2 coords) for the vectorized distance pass, rebuilt only after a change
+        if self._coords is None:
+            self._ids = list(self.gigs)
+            self._coords = np.array([self.gigs[gig_id] for gig_id in self._ids], dtype=float).reshape(-1, 2)
+        return self._ids, self._coords
+
+    def invalidate(self):
+        self._ids = self._coords = None
+
+
+class GigIndex:
+    """
+    In-memory geohash-style grid over gig coordinates. A lookup collects the
+    cells overlapping the search radius and runs one vectorized haversine pass
+    over just those candidates.
+    """
+
+    def __init__(self, cell_degrees=GIG_INDEX_CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self._cells = {}  # (row, col) -> _Cell
+        self._gigs = {}  # gig_id -> (cell_key, info)
+        self._lock = threading.Lock()
+
+    def _cell_key(self, lat, lon):
+        return (math.floor(lat / self.cell_degrees), math.floor(lon / self.cell_degrees))
+
+    def add(self, gig_id, lat, lon, info=None):
+        key = self._cell_key(lat, lon)
+        with self._lock:
+            self._discard(gig_id)
+            cell = self._cells.setdefault(key, _Cell())
+            cell.gigs[gig_id] = (lat, lon)
+            cell.invalidate()
+            self._gigs[gig_id] = (key, info or {})
+
+    def remove(self, gig_id):
+        with self._lock:
+            self._discard(gig_id)
+
+    def _discard(self, gig_id):
+        # Caller must hold self._lock
+        entry = self._gigs.pop(gig_id, None)
+        if entry is None:
+            return
+        cell = self._cells[entry[0]]
+        cell.gigs.pop(gig_id, None)
+        cell.invalidate()
+        if not cell.gigs:
+            del self._cells[entry[0]]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._gigs)
+
+    def ids(self):
+        with self._lock:
+            return set(self._gigs)
+
+    def nearby(self, lat, lon, radius_miles, limit=20):
+        """Returns up to `limit` (gig_id, distance_miles, info) tuples within the radius, nearest first."""
+        if not all(math.isfinite(value) for value in (lat, lon, radius_miles)):
+            raise ValueError("lat, lon and radius_miles must be finite numbers.")
+        lat_span = math.ceil(radius_miles / _MILES_PER_DEGREE_LAT / self.cell_degrees)
+        cos_lat = max(math.cos(math.radians(min(abs(lat) + lat_span * self.cell_degrees, 89.0))), 0.01)
+        lon_span = math.ceil(radius_miles / (_MILES_PER_DEGREE_LAT * cos_lat) / self.cell_degrees)
+        row, col = self._cell_key(lat, lon)
+
+        ids, chunks = [], []
+        with self._lock:
+            for r in range(row - lat_span, row + lat_span + 1):
+                for c in range(col - lon_span, col + lon_span + 1):
+                    cell = self._cells.get((r, c))
+                    if cell is not None:
+                        cell_ids, coords = cell.arrays()
+                        ids.extend(cell_ids)
+                        chunks.append(coords)
+            infos = {gig_id: self._gigs[gig_id][1] for gig_id in ids}
+
+        if not ids:
+            return []
+
+        distances = haversine_vector(np.vstack(chunks), np.array([[lat, lon]]), Unit.MILES, comb=True)[0]
+        within = np.flatnonzero(distances <= radius_miles)
+        nearest = within[np.argsort(distances[within], kind='stable')][:limit]
+        return [(ids[i], float(distances[i]), infos[ids[i]]) for i in nearest]
+
+
+gig_index = GigIndex()
+_sync_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+_last_started = None  # monotonic time this worker last started a background sync
+_last_sync = None  # (monotonic time, ISO timestamp) of the last Airtable sync
+_last_full_sync = None  # monotonic time of the last full reload
+_coordinates_stored = True  # cleared if gigs_tbl turns out not to have the coordinate fields yet
+_known_gigs = None  # every gig_id in gigs_tbl, placeable or not; None until the first full sync lands
+
+
+def gig_exists(gig_id):
+    """
+    Whether gig_id is in gigs_tbl as of the last sync (or was created through
+    this worker since), or None while this worker's first full sync is running.
+    """
+    known = _known_gigs
+    return None if known is None else gig_id in known
+
+
+def note_gig(gig_id):
+    """Records a gig created through this worker, so it exists here before the next sync."""
+    if _known_gigs is not None:
+        _known_gigs.add(gig_id)
+
+
+def gig_info(fields):
+    return {name: fields.get(name) for name in GIG_FIELDS}
+
+
+def stored_coordinates(fields):
+    """Returns the (lat, lon) saved on a gig record, or None if it has none."""
+    try:
+        lat, lon = (float(fields[name]) for name in GIG_COORDINATE_FIELDS)
+    except (KeyError, TypeError, ValueError):
+        return None
+    return lat, lon
+
+
+def coordinate_fields(lat, lon):
+    """The gig record fields that store its coordinates, or {} if gigs_tbl has no place for them."""
+    return dict(zip(GIG_COORDINATE_FIELDS, (lat, lon))) if _coordinates_stored else {}
+
+
+def coordinates_unsupported():
+    global _coordinates_stored
+    if _coordinates_stored:
+        logging.warning(f"gigs_tbl has no {'/'.join(GIG_COORDINATE_FIELDS)} fields; "
+                        "gigs will be geocoded on every sync until they are added.")
+    _coordinates_stored = False
+
+
+def index_gig(fields, record_id=None):
+    """
+    Adds a gig to the index at its stored coordinates, geocoding its
+    city/state only when it has none. With `record_id`, coordinates found that
+    way are written back to the gig so they are looked up once.
+    """
+    gig_id = fields.get('gig_id')
+    city = fields.get('city')
+    state = fields.get('state')
+    coordinates = stored_coordinates(fields)
+    if not gig_id or (coordinates is None and not (city and state)):
+        return False
+    if coordinates is None:
+        coordinates = get_coordinates(city=city, state=state)
+        if record_id and coordinate_fields(*coordinates):
+            batch_writer.update(GIGS_TABLE_NAME, record_id, coordinate_fields(*coordinates))
+    gig_index.add(gig_id, *coordinates, gig_info(fields))
+    return True
+
+
+def _fetch_gigs(params):
+    fields = list(GIG_FIELDS) + (list(GIG_COORDINATE_FIELDS) if _coordinates_stored else [])
+    try:
+        yield from airtable.iter_records(GIGS_TABLE_NAME, dict(params, **{'fields[]': fields}))
+    except requests.HTTPError as e:
+        # Airtable rejects the unknown fields on the first page, so nothing was yielded yet
+        if not _coordinates_stored or not is_unknown_field_error(e):
+            raise
+        coordinates_unsupported()
+        yield from airtable.iter_records(GIGS_TABLE_NAME, dict(params, **{'fields[]': list(GIG_FIELDS)}))
+
+
+def sync_gig_index():
+    """
+    Loads gigs into the index: everything on the first call and every
+    GIG_INDEX_FULL_SYNC_SECONDS (dropping gigs no longer in gigs_tbl), and
+    otherwise only gigs added or edited since the previous sync (via
+    LAST_MODIFIED_TIME()).
+    """
+    global _last_sync, _last_full_sync, _known_gigs
+    with _sync_lock:
+        started = time.monotonic()
+        started_at = time.time() - AIRTABLE_CURSOR_OVERLAP_SECONDS
+        full = _last_sync is None or _last_full_sync is None or started - _last_full_sync >= GIG_INDEX_FULL_SYNC_SECONDS
+        params = {'pageSize': 100}
+        if not full:
+            params['filterByFormula'] = f"IS_AFTER(LAST_MODIFIED_TIME(), '{_last_sync[1]}')"
+
+        indexed, seen = 0, set()
+        for record in _fetch_gigs(params):
+            fields = record.get('fields', {})
+            seen.add(fields.get('gig_id'))
+            try:
+                indexed += index_gig(fields, record.get('id'))
+            except Exception as e:
+                logging.warning(f"Could not index gig {record.get('id')}: {e}")
+
+        removed = 0
+        if full:
+            for gig_id in gig_index.ids() - seen:
+                gig_index.remove(gig_id)
+                removed += 1
+            _last_full_sync = started
+            _known_gigs = seen - {None}
+        else:
+            _known_gigs.update(seen - {None})
+        _last_sync = (started, utc_iso(started_at))
+        logging.info(f"Gig index synced ({'full' if full else 'incremental'}): {indexed} gig(s) indexed, "
+                     f"{removed} removed, {len(gig_index)} in index.")
+
+
+def _sync_in_background():
+    try:
+        sync_gig_index()
+    except Exception as e:
+        logging.warning(f"Background gig index sync failed: {e}")
+
+
+def ensure_gig_index_fresh():
+    """
+    Starts a background sync on first use and whenever this worker's last one
+    started more than GIG_INDEX_REFRESH_SECONDS ago, failed or not. Never
+    blocks the caller: until the first sync lands, searches only see gigs this
+    worker created.
+    """
+    global _last_started
+    with _refresh_lock:
+        if _last_started is not None and time.monotonic() - _last_started < GIG_INDEX_REFRESH_SECONDS:
+            return
+        _last_started = time.monotonic()
+    threading.Thread(target=_sync_in_background, name="gig-index-sync", daemon=True).start()
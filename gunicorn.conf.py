@@ -0,0 +1,11 @@
+# Gunicorn picks this file up automatically from the working directory
+import os
+
+# Threads per worker (gthread), so long-polling dashboards don't tie up the whole worker
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+
+
+def post_worker_init(worker):
+    # Threads, file locks and the scheduler start in the worker process itself, after the fork
+    from app import start_background_services
+    start_background_services()
@@ -0,0 +1,53 @@
+import os
+import sqlite3
+import threading
+
+# Where on-disk caches, cursors and queues live (point at a persistent disk in production)
+STATE_DIR = os.getenv("STATE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".state"))
+# False when STATE_DIR fell back to the checkout's .state, which a deploy wipes
+STATE_DIR_CONFIGURED = bool(os.getenv("STATE_DIR"))
+
+
+def connect(name):
+    """
+    Opens (creating if needed) the SQLite database `<STATE_DIR>/<name>.sqlite3`.
+    Connections run in autocommit mode with WAL enabled, so readers never block
+    the writer and several gunicorn workers can share one file.
+    """
+    os.makedirs(STATE_DIR, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(STATE_DIR, f"{name}.sqlite3"), timeout=30,
+                           isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class LocalDB:
+    """
+    A module's lazily opened connection to `<STATE_DIR>/<name>.sqlite3`,
+    shared by its threads. `with db as conn:` holds the connection's lock for
+    the block; `schema(conn)` runs once, when the connection is first opened.
+    """
+
+    def __init__(self, name, schema=None):
+        self.name = name
+        self.schema = schema
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self._lock.acquire()
+        try:
+            if self._conn is None:
+                conn = connect(self.name)
+                if self.schema is not None:
+                    self.schema(conn)
+                self._conn = conn
+        except BaseException:
+            self._lock.release()
+            raise
+        return self._conn
+
+    def __exit__(self, *exc_info):
+        self._lock.release()
+        return False
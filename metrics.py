@@ -0,0 +1,164 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; spans a cache hit through a slow, retried Airtable call
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}  # label values tuple -> metric-specific state
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = sorted(self._values.items())
+            lines.extend(self._render_samples(items))
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_samples(self, items):
+        return [f'{self.name}{_format_labels(self.label_names, key)} {value:g}' for key, value in items]
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _render_samples(self, items):
+        return [f'{self.name}{_format_labels(self.label_names, key)} {value:g}' for key, value in items]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, then sum and count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _render_samples(self, items):
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                lines.append(f'{self.name}_bucket{_format_labels(self.label_names, key, [("le", le)])} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.label_names, key)} {total:.6f}')
+            lines.append(f'{self.name}_count{_format_labels(self.label_names, key)} {count}')
+        return lines
+
+
+def render():
+    """All registered metrics in the Prometheus text exposition format."""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# Outbound calls to Airtable, Stripe, ClickSend and Nominatim (one observation per attempt)
+outbound_latency = Histogram('nxtsong_outbound_request_seconds', 'Latency of calls to external services.',
+                             labels=('service', 'operation'))
+outbound_requests = Counter('nxtsong_outbound_requests_total', 'Calls to external services by outcome.',
+                            labels=('service', 'operation', 'status'))
+outbound_retries = Counter('nxtsong_outbound_retries_total', 'Retried calls to external services.',
+                           labels=('service', 'operation'))
+
+# Inbound HTTP routes
+route_latency = Histogram('nxtsong_http_request_seconds', 'Time spent handling HTTP requests.',
+                          labels=('method', 'route'))
+route_responses = Counter('nxtsong_http_responses_total', 'HTTP responses by status code.',
+                          labels=('method', 'route', 'status'))
+
+# Notify pipeline (check_and_notify)
+notify_cycle_latency = Histogram('nxtsong_notify_cycle_seconds', 'Duration of check_and_notify cycles.',
+                                 labels=('mode',), buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300))
+notify_backlog = Gauge('nxtsong_notify_backlog_records',
+                       'Accepted, unnotified records seen by the last check_and_notify cycle.')
+notify_retry_backlog = Gauge('nxtsong_notify_retry_backlog_records',
+                             'Failed records whose retry backoff had expired at the last cycle.')
+notify_outcomes = Counter('nxtsong_notify_records_total', 'Records handled by the notify pipeline.',
+                          labels=('outcome',))
+
+# Admission control and request coalescing
+admission_rejections = Counter('nxtsong_admission_rejections_total', 'Requests shed with a 429 before reaching a view.',
+                               labels=('route', 'scope'))
+coalesced_calls = Counter('nxtsong_coalesced_calls_total', 'Calls that shared an identical in-flight upstream call.',
+                          labels=('name',))
+
+
+@contextmanager
+def track_call(service, operation):
+    """
+    Times one outbound call and counts it by outcome: 'ok', the HTTP status of
+    a raised error when it carries one (Stripe and ClickSend errors do), or 'error'.
+    """
+    started = time.perf_counter()
+    status = 'ok'
+    try:
+        yield
+    except Exception as e:
+        status = str(getattr(e, 'http_status', None) or getattr(e, 'status', None) or 'error')
+        raise
+    finally:
+        outbound_latency.observe(time.perf_counter() - started, service=service, operation=operation)
+        outbound_requests.inc(service=service, operation=operation, status=status)
@@ -0,0 +1,61 @@
+import os
+import time
+
+import local_db
+
+# Pipeline steps in order; a record resumes after the last one it finished
+PENDING = 'pending'
+CHARGED = 'charged'
+TEXTED = 'texted'
+MARKED = 'marked'
+STEPS = (PENDING, CHARGED, TEXTED, MARKED)
+
+# Finished rows are kept this long so a lagging Airtable read can't trigger a second charge
+OUTBOX_RETENTION_DAYS = float(os.getenv("NOTIFY_OUTBOX_RETENTION_DAYS", "30"))
+
+
+def _schema(conn):
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS outbox ("
+        " record_id TEXT PRIMARY KEY, request_id TEXT, step TEXT NOT NULL,"
+        " payment_intent_id TEXT, updated_at REAL NOT NULL)"
+    )
+
+
+_db = local_db.LocalDB("notify_outbox", _schema)
+
+
+def get_steps(record_ids):
+    """Returns {record_id: (step, payment_intent_id)} for records the outbox has seen."""
+    record_ids = list(record_ids)
+    steps = {}
+    with _db as conn:
+        for i in range(0, len(record_ids), 500):
+            chunk = record_ids[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT record_id, step, payment_intent_id FROM outbox WHERE record_id IN ({placeholders})", chunk
+            )
+            steps.update((record_id, (step, payment_intent_id)) for record_id, step, payment_intent_id in rows)
+    return steps
+
+
+def advance(record_id, step, request_id=None, payment_intent_id=None):
+    """Records that `record_id` finished `step`; never moves a record backwards."""
+    with _db as conn:
+        row = conn.execute("SELECT step FROM outbox WHERE record_id = ?", (record_id,)).fetchone()
+        if row and STEPS.index(row[0]) >= STEPS.index(step):
+            return
+        conn.execute(
+            "INSERT INTO outbox (record_id, request_id, step, payment_intent_id, updated_at) VALUES (?, ?, ?, ?, ?)"
+            " ON CONFLICT(record_id) DO UPDATE SET step = excluded.step, updated_at = excluded.updated_at,"
+            " request_id = COALESCE(excluded.request_id, outbox.request_id),"
+            " payment_intent_id = COALESCE(excluded.payment_intent_id, outbox.payment_intent_id)",
+            (record_id, request_id, step, payment_intent_id, time.time())
+        )
+
+
+def prune():
+    cutoff = time.time() - OUTBOX_RETENTION_DAYS * 86400
+    with _db as conn:
+        conn.execute("DELETE FROM outbox WHERE step = ? AND updated_at < ?", (MARKED, cutoff))
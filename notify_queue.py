@@ -0,0 +1,50 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+from airtable_utils import notify_records
+
+# How long the worker keeps collecting ids after the first one arrives, so a burst of acceptances shares one run
+NOTIFY_TRIGGER_WINDOW = float(os.getenv("NOTIFY_TRIGGER_WINDOW_MS", "250")) / 1000
+NOTIFY_TRIGGER_MAX_BATCH = 100
+
+_pending = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def enqueue(record_ids):
+    """Queues accepted record ids for immediate processing by the notify worker thread."""
+    global _worker
+    for record_id in record_ids:
+        _pending.put(record_id)
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name="notify-trigger", daemon=True)
+            _worker.start()
+
+
+def _drain():
+    batch = {_pending.get()}
+    deadline = time.monotonic() + NOTIFY_TRIGGER_WINDOW
+    while len(batch) < NOTIFY_TRIGGER_MAX_BATCH:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            batch.add(_pending.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return batch
+
+
+def _run():
+    while True:
+        batch = _drain()
+        try:
+            notify_records(batch)
+        except Exception as e:
+            # The scheduled poll is the safety net for anything that fails here
+            logging.error(f"Triggered notify failed for {len(batch)} record(s): {e}")
@@ -0,0 +1,93 @@
+import os
+import time
+
+import local_db
+
+# Retry backoff for records that keep failing the notify pipeline: base * 2^(attempts-1), capped
+NOTIFY_RETRY_BASE_SECONDS = float(os.getenv("NOTIFY_RETRY_BASE_SECONDS", "120"))
+NOTIFY_RETRY_CAP_SECONDS = float(os.getenv("NOTIFY_RETRY_CAP_SECONDS", str(6 * 3600)))
+
+
+def _schema(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT)")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS attempts ("
+        " record_id TEXT PRIMARY KEY, attempts INTEGER NOT NULL, next_attempt_at REAL NOT NULL,"
+        " last_error TEXT, updated_at REAL NOT NULL)"
+    )
+    # What the record looked like when it last failed; ledgers from before this column have it NULL
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(attempts)")}
+    if 'fingerprint' not in columns:
+        conn.execute("ALTER TABLE attempts ADD COLUMN fingerprint TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS attempts_next ON attempts (next_attempt_at)")
+
+
+_db = local_db.LocalDB("notify_state", _schema)
+
+
+def get_value(key, default=None):
+    with _db as conn:
+        row = conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else default
+
+
+def set_value(key, value):
+    with _db as conn:
+        conn.execute("INSERT OR REPLACE INTO kv VALUES (?, ?)", (key, value))
+
+
+def record_failure(record_id, error, fingerprint=None):
+    """
+    Bumps the record's attempt count and schedules its next retry with
+    exponential backoff. `fingerprint` identifies the record's contents, so a
+    later edit (e.g. a new card) can skip the wait; see backing_off().
+    """
+    now = time.time()
+    with _db as conn:
+        row = conn.execute("SELECT attempts FROM attempts WHERE record_id = ?", (record_id,)).fetchone()
+        attempts = (row[0] if row else 0) + 1
+        delay = min(NOTIFY_RETRY_CAP_SECONDS, NOTIFY_RETRY_BASE_SECONDS * (2 ** (attempts - 1)))
+        conn.execute("INSERT OR REPLACE INTO attempts (record_id, attempts, next_attempt_at, last_error,"
+                     " updated_at, fingerprint) VALUES (?, ?, ?, ?, ?, ?)",
+                     (record_id, attempts, now + delay, str(error)[:500], now, fingerprint))
+    return attempts
+
+
+def clear(record_ids):
+    with _db as conn:
+        conn.executemany("DELETE FROM attempts WHERE record_id = ?", [(record_id,) for record_id in record_ids])
+
+
+def backing_off(record_ids, fingerprints=None):
+    """
+    Returns the subset of `record_ids` whose next retry is still in the future.
+    With `fingerprints` ({record_id: fingerprint}), a record whose contents
+    changed since its last failure is not held back.
+    """
+    record_ids = list(record_ids)
+    if not record_ids:
+        return set()
+    fingerprints = fingerprints or {}
+    now = time.time()
+    with _db as conn:
+        found = set()
+        for i in range(0, len(record_ids), 500):
+            chunk = record_ids[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT record_id, fingerprint FROM attempts"
+                f" WHERE next_attempt_at > ? AND record_id IN ({placeholders})",
+                [now] + chunk
+            )
+            found.update(record_id for record_id, fingerprint in rows
+                         if fingerprint is None or fingerprints.get(record_id, fingerprint) == fingerprint)
+    return found
+
+
+def due_record_ids(limit=500):
+    with _db as conn:
+        rows = conn.execute(
+            "SELECT record_id FROM attempts WHERE next_attempt_at <= ? ORDER BY next_attempt_at LIMIT ?",
+            (time.time(), limit)
+        ).fetchall()
+    return [row[0] for row in rows]
@@ -0,0 +1,55 @@
+import fcntl
+import os
+import threading
+
+import local_db
+
+
+class FileLock:
+    """
+    Cross-process lock backed by flock() on `<STATE_DIR>/<name>.lock`, also
+    safe to share between threads of one process. The kernel drops the lock
+    when the holding process exits, so a crashed leader never wedges others.
+    """
+
+    def __init__(self, name):
+        self.path = os.path.join(local_db.STATE_DIR, f"{name}.lock")
+        self._thread_lock = threading.Lock()
+        self._file = None
+
+    def acquire(self, blocking=True):
+        if not self._thread_lock.acquire(blocking):
+            return False
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            lock_file = open(self.path, 'a+')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                lock_file.close()
+                self._thread_lock.release()
+                return False
+            lock_file.seek(0)
+            lock_file.truncate()
+            lock_file.write(str(os.getpid()))
+            lock_file.flush()
+            self._file = lock_file
+            return True
+        except Exception:
+            self._thread_lock.release()
+            raise
+
+    def release(self):
+        lock_file, self._file = self._file, None
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+        finally:
+            self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
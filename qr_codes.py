@@ -0,0 +1,134 @@
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+import urllib.parse
+
+import local_db
+from airtable_client import airtable, formula_string
+from singleflight import SingleFlight
+from ttl_cache import TTLCache
+
+# Rendered QR images live here, named by a hash of the encoded data, so identical gigs share files
+QR_CACHE_DIR = os.getenv("QR_CACHE_DIR", os.path.join(local_db.STATE_DIR, "qr"))
+# Target edge lengths in pixels; each image is the largest whole-module scale that fits
+QR_SIZES = (200, 400, 800)
+QR_DEFAULT_SIZE = 800
+QR_FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+QR_BORDER = 4  # quiet zone in modules, as the QR spec asks for
+# Guests scanning a gig's QR code land on this Tally form, prefilled with the gig's details
+TALLY_FORM_URL = 'https://tally.so/r/wvKEk4'
+FORM_URL_PARAMS = ('gig_id', 'dj_name', 'venue', 'city', 'state')
+GIGS_TABLE_NAME = 'gigs_tbl'
+# gigs_tbl field holding the exact URL a gig's QR code encodes, so any instance can render it again
+FORM_URL_FIELD = 'form_url'
+
+# A post-deploy burst of scans for one gig shares a single gigs_tbl lookup, and unknown gig_ids are
+# remembered briefly so they can't be used to hammer Airtable
+_gig_lookups = SingleFlight('qr_gig_lookup')
+_missing_gigs = TTLCache(maxsize=4096, ttl=60)
+
+
+def _schema(conn):
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS gig_qr (gig_id TEXT PRIMARY KEY, digest TEXT NOT NULL, data TEXT NOT NULL,"
+        " created_at REAL NOT NULL)"
+    )
+
+
+_db = local_db.LocalDB("qr_codes", _schema)
+
+
+def gig_form_url(fields):
+    """The Tally form URL a gig's QR code points at."""
+    return f"{TALLY_FORM_URL}?{urllib.parse.urlencode({name: fields.get(name) for name in FORM_URL_PARAMS})}"
+
+
+def content_digest(data):
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def qr_path(digest, size, fmt):
+    return os.path.join(QR_CACHE_DIR, digest[:2], f"{digest}-{size}.{fmt}")
+
+
+def _write_atomically(path, payload):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(payload)
+    os.replace(tmp_path, path)
+
+
+def render(data):
+    """
+    Renders `data` as PNG and SVG at every QR_SIZES size into the cache and
+    returns its digest. Images already on disk are not rendered again.
+    """
+    digest = content_digest(data)
+    missing = [(size, fmt) for size in QR_SIZES for fmt in QR_FORMATS if not os.path.exists(qr_path(digest, size, fmt))]
+    if not missing:
+        return digest
+
+    import segno
+    qr = segno.make(data, error='m')
+    modules = qr.symbol_size(scale=1, border=QR_BORDER)[0]
+    for size, fmt in missing:
+        buffer = io.BytesIO()
+        qr.save(buffer, kind=fmt, scale=max(1, size // modules), border=QR_BORDER)
+        _write_atomically(qr_path(digest, size, fmt), buffer.getvalue())
+    return digest
+
+
+def render_gig_qr(gig_id, data):
+    """Renders the gig's QR code (see render) and remembers which digest belongs to the gig."""
+    digest = render(data)
+    with _db as conn:
+        conn.execute("INSERT OR REPLACE INTO gig_qr VALUES (?, ?, ?, ?)", (gig_id, digest, data, time.time()))
+    return digest
+
+
+def nearest_size(size):
+    """Snaps a requested size to the closest pre-rendered one."""
+    return min(QR_SIZES, key=lambda candidate: abs(candidate - size))
+
+
+def _gig_record_data(gig_id):
+    # Deploys wipe STATE_DIR and instances don't share it, so gigs_tbl is the source of truth
+    params = {'filterByFormula': f"gig_id={formula_string(gig_id)}", 'maxRecords': 1}
+    records = airtable.get(GIGS_TABLE_NAME, params=params).json().get('records', [])
+    if not records:
+        return None
+    fields = records[0].get('fields', {})
+    # Gigs created before form_url was stored get the same URL rebuilt from their details
+    return fields.get(FORM_URL_FIELD) or gig_form_url(fields)
+
+
+def gig_image(gig_id, size, fmt):
+    """
+    Returns (digest, image bytes) for the gig's QR code at a QR_SIZES size, or
+    None if no such gig exists. A gig this instance hasn't seen (after a
+    redeploy, or created on another instance) is rendered from its gigs_tbl
+    record, and images missing from disk are rendered again from the stored
+    data. Airtable errors propagate.
+    """
+    with _db as conn:
+        row = conn.execute("SELECT digest, data FROM gig_qr WHERE gig_id = ?", (gig_id,)).fetchone()
+    if row:
+        digest, data = row
+    else:
+        if gig_id in _missing_gigs:
+            return None
+        data = _gig_lookups.do(gig_id, lambda: _gig_record_data(gig_id))
+        if data is None:
+            _missing_gigs.set(gig_id, True)
+            return None
+        digest = render_gig_qr(gig_id, data)
+    path = qr_path(digest, size, fmt)
+    if not os.path.exists(path):
+        logging.warning(f"QR image {digest}-{size}.{fmt} missing from cache; rendering it again.")
+        render(data)
+    with open(path, 'rb') as f:
+        return digest, f.read()
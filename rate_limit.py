@@ -0,0 +1,40 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled at `rate` tokens per second up to
+    `capacity`. `acquire()` blocks until a token is available; `try_acquire()`
+    never blocks and returns how long the caller would have to wait instead.
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        # Caller must hold self._lock
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens=1):
+        """Takes `tokens` if available and returns 0.0, otherwise returns the seconds to wait."""
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens=1):
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return
+            time.sleep(wait)
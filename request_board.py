@@ -0,0 +1,237 @@
+import bisect
+import itertools
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+from airtable_client import airtable, formula_string, UNNOTIFIED_FORMULA
+from structured_logging import SAMPLED
+
+REQUESTS_TABLE_NAME = 'song_requests_tbl'
+# What the public leaderboard shows per request; guest names, messages, phone numbers and payment fields stay out
+BOARD_FIELDS = ('request_id', 'gig_id', 'song_name', 'artist_name', 'bid_amount')
+# Requests created or notified through other workers reach this worker's board on the next reload
+REQUEST_BOARD_REFRESH_SECONDS = int(os.getenv("REQUEST_BOARD_REFRESH_SECONDS", "30"))
+# Gigs kept in memory; the least recently read ones are dropped first
+REQUEST_BOARD_MAX_GIGS = int(os.getenv("REQUEST_BOARD_MAX_GIGS", "256"))
+# Local writes newer than this survive a reload that doesn't show them yet (async ingest, Airtable lag)
+REQUEST_BOARD_GRACE_SECONDS = 120
+
+# Versions are unique per process, so ETags from another worker or a restarted one never match
+_INSTANCE = uuid.uuid4().hex[:8]
+
+
+def _bid(fields):
+    try:
+        return float(fields.get('bid_amount') or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class _GigBoard:
+    __slots__ = ('ranked', 'entries', 'version', 'loaded_at', 'loading')
+
+    def __init__(self):
+        self.ranked = []  # sorted (-bid, created_at, request_id): highest bid first, then oldest
+        self.entries = {}  # request_id -> (rank key, info, added locally at or None)
+        self.version = 0
+        self.loaded_at = None  # monotonic time of the last Airtable load
+        self.loading = False
+
+
+class RequestBoard:
+    """
+    Per-gig ranked index of pending (unnotified) song requests, kept in a
+    sorted list: an entry is found by bisection, inserting or removing one
+    shifts the list (linear, but a single memmove at a gig's size), and the
+    top N is a slice off its front. Every change bumps the gig's version and
+    wakes long-pollers.
+    """
+
+    def __init__(self, max_gigs=REQUEST_BOARD_MAX_GIGS):
+        self.max_gigs = max_gigs
+        self._gigs = OrderedDict()  # gig_id -> _GigBoard, least recently used first
+        self._versions = itertools.count(1)
+        self._changed = threading.Condition()
+
+    def _board(self, gig_id):
+        # Caller must hold self._changed
+        board = self._gigs.get(gig_id)
+        if board is None:
+            board = self._gigs[gig_id] = _GigBoard()
+            while len(self._gigs) > self.max_gigs:
+                self._gigs.popitem(last=False)
+        self._gigs.move_to_end(gig_id)
+        return board
+
+    def _put(self, board, request_id, fields, created_at, added_at):
+        # Caller must hold self._changed; returns True if the board changed
+        info = {name: fields.get(name) for name in BOARD_FIELDS}
+        key = (-_bid(fields), created_at, request_id)
+        entry = board.entries.get(request_id)
+        if entry is not None:
+            if entry[0][0] == key[0] and entry[1] == info:
+                return False
+            # Keep the original arrival time so a re-read doesn't reorder ties
+            key = (key[0], entry[0][1], request_id)
+            board.ranked.pop(bisect.bisect_left(board.ranked, entry[0]))
+        bisect.insort(board.ranked, key)
+        board.entries[request_id] = (key, info, added_at)
+        return True
+
+    def _remove(self, board, request_id):
+        entry = board.entries.pop(request_id, None)
+        if entry is None:
+            return False
+        board.ranked.pop(bisect.bisect_left(board.ranked, entry[0]))
+        return True
+
+    def _bump(self, board):
+        board.version = next(self._versions)
+        self._changed.notify_all()
+
+    def add(self, gig_id, fields):
+        """Adds or updates a request written through this worker."""
+        request_id = fields.get('request_id')
+        if not gig_id or not request_id:
+            return
+        with self._changed:
+            board = self._board(gig_id)
+            if self._put(board, request_id, fields, time.time(), time.monotonic()):
+                self._bump(board)
+
+    def discard(self, gig_id, request_id):
+        """Drops a request that is no longer pending, e.g. once it was notified."""
+        with self._changed:
+            board = self._gigs.get(gig_id)
+            if board is not None and self._remove(board, request_id):
+                self._bump(board)
+
+    def replace(self, gig_id, records, loaded_at):
+        """
+        Syncs a gig to `records` (Airtable API records of its pending requests)
+        read at `loaded_at`. Local additions newer than the grace period are kept.
+        """
+        with self._changed:
+            board = self._board(gig_id)
+            changed = False
+            seen = set()
+            for record in records:
+                fields = record.get('fields', {})
+                request_id = fields.get('request_id')
+                if not request_id:
+                    continue
+                seen.add(request_id)
+                created_at = _created_time(record.get('createdTime'))
+                changed |= self._put(board, request_id, fields, created_at, None)
+            for request_id, (_, _, added_at) in list(board.entries.items()):
+                if request_id in seen:
+                    continue
+                if added_at is None or loaded_at - added_at > REQUEST_BOARD_GRACE_SECONDS:
+                    changed |= self._remove(board, request_id)
+            board.loaded_at = loaded_at
+            if changed or not board.version:
+                self._bump(board)
+
+    def top(self, gig_id, limit):
+        """Returns (version, total, top `limit` requests by bid) for a loaded gig."""
+        with self._changed:
+            board = self._board(gig_id)
+            return board.version, len(board.ranked), [dict(board.entries[key[2]][1]) for key in board.ranked[:limit]]
+
+    def version(self, gig_id):
+        with self._changed:
+            return self._version_locked(gig_id)
+
+    def wait_for_change(self, gig_id, version, timeout):
+        """Blocks until the gig's version differs from `version` or `timeout` passes; returns True on a change."""
+        with self._changed:
+            return self._changed.wait_for(lambda: self._version_locked(gig_id) != version, timeout)
+
+    def _version_locked(self, gig_id):
+        board = self._gigs.get(gig_id)
+        return board.version if board is not None else 0
+
+    def claim_load(self, gig_id):
+        """
+        Returns (should load, never loaded). Only one thread loads a gig at a
+        time, and only once its last load is older than REQUEST_BOARD_REFRESH_SECONDS.
+        """
+        with self._changed:
+            board = self._board(gig_id)
+            fresh = board.loaded_at is not None and time.monotonic() - board.loaded_at < REQUEST_BOARD_REFRESH_SECONDS
+            if fresh or board.loading:
+                return False, board.loaded_at is None
+            board.loading = True
+            return True, board.loaded_at is None
+
+    def release_load(self, gig_id):
+        with self._changed:
+            board = self._gigs.get(gig_id)
+            if board is not None:
+                board.loading = False
+            self._changed.notify_all()
+
+    def wait_for_load(self, gig_id, timeout):
+        with self._changed:
+            self._changed.wait_for(lambda: not getattr(self._gigs.get(gig_id), 'loading', False), timeout)
+
+
+def board_etag(version, limit):
+    return f"{_INSTANCE}-{version}-{limit}"
+
+
+def _created_time(value):
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    except (AttributeError, ValueError):
+        return time.time()
+
+
+request_board = RequestBoard()
+
+
+def load_gig(gig_id):
+    """Reads the gig's pending requests from Airtable into the board."""
+    started = time.monotonic()
+    params = {
+        'filterByFormula': f"AND(gig_id={formula_string(gig_id)}, {UNNOTIFIED_FORMULA})",
+        'fields[]': list(BOARD_FIELDS),
+        'pageSize': 100,
+    }
+    records = list(airtable.iter_records(REQUESTS_TABLE_NAME, params))
+    request_board.replace(gig_id, records, started)
+    logging.info(f"Request board loaded {len(records)} pending request(s) for gig {gig_id}.", extra=SAMPLED)
+
+
+def _load_in_background(gig_id):
+    try:
+        load_gig(gig_id)
+    except Exception as e:
+        logging.warning(f"Request board reload for gig {gig_id} failed: {e}")
+    finally:
+        request_board.release_load(gig_id)
+
+
+def ensure_gig_loaded(gig_id):
+    """
+    Blocks for the gig's first load in this worker; afterwards a board older
+    than REQUEST_BOARD_REFRESH_SECONDS reloads in the background.
+    """
+    needs_load, first = request_board.claim_load(gig_id)
+    if not needs_load:
+        if first:
+            # Another thread is doing the first load; wait for it rather than serve an empty board
+            request_board.wait_for_load(gig_id, REQUEST_BOARD_REFRESH_SECONDS)
+        return
+    if first:
+        try:
+            load_gig(gig_id)
+        finally:
+            request_board.release_load(gig_id)
+    else:
+        threading.Thread(target=_load_in_background, args=(gig_id,), name="request-board-load", daemon=True).start()
@@ -1,10 +1,36 @@
-from apscheduler.schedulers.background import BackgroundScheduler
 import logging
+import os
+import threading
 from airtable_utils import check_and_notify
+from process_lock import FileLock
 
-def start_scheduler():
+# With the acceptance webhook wired up the poll is only a safety net, so it can run far less often
+_default_interval = "10" if os.getenv("NOTIFY_WEBHOOK_SECRET") else "2"
+POLL_INTERVAL_MINUTES = float(os.getenv("NOTIFY_POLL_INTERVAL_MINUTES", _default_interval))
+# How often standby workers check whether the leader has gone away
+LEADER_RETRY_SECONDS = float(os.getenv("SCHEDULER_LEADER_RETRY_SECONDS", "30"))
+
+# Only the process holding this lock runs the notify job; the others just serve HTTP
+leader_lock = FileLock("scheduler_leader")
+_scheduler = None
+
+def start_scheduler(_retry=False):
+    global _scheduler
+    if _scheduler is not None:
+        return
+
+    if not leader_lock.acquire(blocking=False):
+        if not _retry:
+            logging.info(f"Scheduler leader lock held elsewhere; worker {os.getpid()} standing by.")
+        retry = threading.Timer(LEADER_RETRY_SECONDS, start_scheduler, kwargs={'_retry': True})
+        retry.daemon = True
+        retry.start()
+        return
+
+    from apscheduler.schedulers.background import BackgroundScheduler
     scheduler = BackgroundScheduler()
-    scheduler.add_job(check_and_notify, 'interval', minutes=2)
+    scheduler.add_job(check_and_notify, 'interval', minutes=POLL_INTERVAL_MINUTES)
     scheduler.start()
+    _scheduler = scheduler
 
-    logging.info("APScheduler started with 2-minute interval.")
+    logging.info(f"APScheduler started with {POLL_INTERVAL_MINUTES:g}-minute interval in leader worker {os.getpid()}.")
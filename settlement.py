@@ -0,0 +1,318 @@
+import csv
+import io
+import json
+import logging
+import os
+import time
+
+import numpy as np
+import requests
+
+import charge_service
+import local_db
+import notify_outbox
+from airtable_client import airtable, formula_string, is_unknown_field_error
+from request_board import REQUESTS_TABLE_NAME
+
+GIGS_TABLE_NAME = 'gigs_tbl'
+SETTLEMENT_FIELDS = ('request_id', 'gig_id', 'notified')
+# Outbox steps at which the notify pipeline has already taken the record's charge
+CHARGED_STEPS = (notify_outbox.CHARGED, notify_outbox.TEXTED, notify_outbox.MARKED)
+# Checkbox on gigs_tbl; once it's ticked a gig's rollup is computed one last time and then served from disk.
+# Set it to "" (or leave the column off gigs_tbl) to recompute every gig on every report
+GIG_CLOSED_FIELD = os.getenv("GIG_CLOSED_FIELD", "closed")
+SETTLEMENT_PAGE_SIZE = 100
+# Stripe's search query language allows at most 10 clauses per query
+STRIPE_SEARCH_CLAUSES = 10
+
+# Integer columns of a rollup row, in cents except for the counts
+TOTAL_COLUMNS = ('charges', 'unmatched', 'gross_cents', 'platform_fee_cents', 'transfer_cents', 'refunded_cents')
+ROLLUP_COLUMNS = ('gig_id', 'dj_connect_id') + TOTAL_COLUMNS
+ACCOUNT_COLUMNS = ('dj_connect_id', 'gigs') + TOTAL_COLUMNS
+
+
+def _schema(conn):
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS gig_rollups ("
+        " gig_id TEXT NOT NULL, dj_connect_id TEXT NOT NULL,"
+        + "".join(f" {name} INTEGER NOT NULL," for name in TOTAL_COLUMNS) +
+        " computed_at REAL NOT NULL, PRIMARY KEY (gig_id, dj_connect_id))"
+    )
+
+
+_db = local_db.LocalDB("settlement", _schema)
+
+
+def cached_rollups(gig_id):
+    """Returns the stored rollup rows of a closed gig, or [] if it hasn't been cached."""
+    with _db as conn:
+        rows = conn.execute(
+            f"SELECT {', '.join(ROLLUP_COLUMNS)} FROM gig_rollups WHERE gig_id = ? ORDER BY dj_connect_id", (gig_id,)
+        ).fetchall()
+    return [dict(zip(ROLLUP_COLUMNS, row)) for row in rows]
+
+
+def cache_rollups(gig_id, rows):
+    with _db as conn:
+        conn.execute("BEGIN")
+        try:
+            conn.execute("DELETE FROM gig_rollups WHERE gig_id = ?", (gig_id,))
+            conn.executemany(
+                f"INSERT INTO gig_rollups ({', '.join(ROLLUP_COLUMNS)}, computed_at)"
+                f" VALUES ({', '.join('?' * (len(ROLLUP_COLUMNS) + 1))})",
+                [tuple(row[name] for name in ROLLUP_COLUMNS) + (time.time(),) for row in rows]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def closed_gig_ids():
+    """
+    Reads the ids of every gig whose GIG_CLOSED_FIELD checkbox is ticked.
+    With no such field configured or on gigs_tbl, no gig counts as closed.
+    """
+    if not GIG_CLOSED_FIELD:
+        return set()
+    params = {'filterByFormula': f"{{{GIG_CLOSED_FIELD}}}", 'fields[]': ['gig_id'], 'pageSize': 100}
+    try:
+        return {record['fields']['gig_id'] for record in airtable.iter_records(GIGS_TABLE_NAME, params)
+                if record.get('fields', {}).get('gig_id')}
+    except requests.HTTPError as e:
+        if not is_unknown_field_error(e):
+            raise
+        logging.warning(f"{GIGS_TABLE_NAME} has no '{GIG_CLOSED_FIELD}' field; settlement rollups won't be cached.")
+        return set()
+
+
+def iter_request_pages(gig_id=None, page_size=SETTLEMENT_PAGE_SIZE):
+    """
+    Lazily follows Airtable's `offset` through the song requests (of one gig,
+    or all of them), sorted by gig_id so each gig's records arrive together,
+    yielding one page of API records at a time. Whether a request was charged
+    is decided against Stripe and the notify outbox, not by an Airtable
+    field: a charge from /charge-customer(s), or one the pipeline took before
+    failing to text, never ticks `notified`.
+    """
+    params = {
+        'fields[]': list(SETTLEMENT_FIELDS),
+        'sort[0][field]': 'gig_id',
+        'sort[0][direction]': 'asc',
+        'pageSize': page_size,
+    }
+    if gig_id is not None:
+        params['filterByFormula'] = f"gig_id={formula_string(gig_id)}"
+    return airtable.iter_pages(REQUESTS_TABLE_NAME, params)
+
+
+def _settled_intent(intents, payment_intent_id=None):
+    # The bid charge carries an application fee; the $0.50 request-fee intent shares its request_id but not that
+    if payment_intent_id:
+        intents = [intent for intent in intents if intent.id == payment_intent_id] or intents
+    charges = [intent for intent in intents if intent.status == 'succeeded' and intent.application_fee_amount is not None]
+    return charges[0] if charges else None
+
+
+def fetch_payment_intents(request_ids, known=None):
+    """
+    Returns {request_id: PaymentIntent} for the succeeded bid charges of
+    `request_ids`, found with Stripe search (10 request_ids per query) and
+    with each intent's latest charge expanded for its refunds. `known` maps
+    request_id -> payment_intent_id (from the notify outbox) and picks the
+    intent when a request was charged more than once.
+    """
+    known = known or {}
+    found = {}
+    request_ids = list(request_ids)
+    for i in range(0, len(request_ids), STRIPE_SEARCH_CLAUSES):
+        chunk = request_ids[i:i + STRIPE_SEARCH_CLAUSES]
+        query = " OR ".join(f"metadata['request_id']:{formula_string(request_id)}" for request_id in chunk)
+        by_request = {}
+        for intent in charge_service.stripe.PaymentIntent.search(
+                query=query, limit=100, expand=['data.latest_charge']).auto_paging_iter():
+            by_request.setdefault((intent.metadata or {}).get('request_id'), []).append(intent)
+        for request_id in chunk:
+            intent = _settled_intent(by_request.get(request_id, []), known.get(request_id))
+            if intent is not None:
+                found[request_id] = intent
+    return found
+
+
+def _intent_amounts(intent):
+    gross = intent.amount_received or 0
+    fee = intent.application_fee_amount or 0
+    transfer_data = intent.transfer_data
+    transfer = transfer_data.amount if transfer_data and transfer_data.amount is not None else gross - fee
+    latest_charge = intent.latest_charge
+    refunded = latest_charge.amount_refunded if latest_charge and not isinstance(latest_charge, str) else 0
+    destination = transfer_data.destination if transfer_data else None
+    if destination is not None and not isinstance(destination, str):
+        destination = destination.id
+    return destination or '', gross, fee, transfer, refunded or 0
+
+
+def aggregate_page(records, intents):
+    """
+    Sums one page of charged records into rollups keyed by (gig_id,
+    dj_connect_id). The page is packed into arrays and grouped with a single
+    np.unique/np.bincount pass per column instead of a Python loop per record.
+    Records without a settled PaymentIntent are counted as unmatched.
+    """
+    keys, amounts = [], []
+    for record in records:
+        fields = record.get('fields', {})
+        intent = intents.get(fields.get('request_id'))
+        if intent is None:
+            keys.append((fields.get('gig_id') or '', ''))
+            amounts.append((1, 0, 0, 0, 0))
+        else:
+            destination, gross, fee, transfer, refunded = _intent_amounts(intent)
+            keys.append((fields.get('gig_id') or '', destination))
+            amounts.append((0, gross, fee, transfer, refunded))
+    if not keys:
+        return {}
+
+    unmatched, gross, fee, transfer, refunded = np.array(amounts, dtype=np.int64).T
+    charges = 1 - unmatched
+    labels = np.array([f"{gig_id}\x1f{account}" for gig_id, account in keys])
+    groups, inverse = np.unique(labels, return_inverse=True)
+    sums = np.stack([np.bincount(inverse, weights=column, minlength=len(groups))
+                     for column in (charges, unmatched, gross, fee, transfer, refunded)]).astype(np.int64)
+    return {tuple(group.split('\x1f', 1)): sums[:, i] for i, group in enumerate(groups)}
+
+
+def _rows(gig_id, totals):
+    return [dict(zip(ROLLUP_COLUMNS, (gig_id, account) + tuple(int(value) for value in sums)))
+            for account, sums in sorted(totals.items())]
+
+
+def _charged_page(records):
+    """
+    Returns the page's charged records and their {request_id: PaymentIntent}.
+    A record is charged if Stripe has a settled bid intent for it, however it
+    was made; one the notify pipeline charged (or marked notified) but Stripe
+    has no intent for is kept too, and counted as unmatched.
+    """
+    request_ids = {record['id']: record['fields']['request_id'] for record in records
+                   if record.get('fields', {}).get('request_id')}
+    steps = notify_outbox.get_steps(request_ids)
+    known = {request_ids[record_id]: payment_intent_id
+             for record_id, (_, payment_intent_id) in steps.items() if payment_intent_id}
+    intents = fetch_payment_intents(request_ids.values(), known)
+    charged = [record for record in records
+               if request_ids.get(record['id']) in intents
+               or record.get('fields', {}).get('notified')
+               or steps.get(record['id'], (None, None))[0] in CHARGED_STEPS]
+    return charged, intents
+
+
+def _record_gig(record):
+    return record.get('fields', {}).get('gig_id') or ''
+
+
+def iter_gig_rollups(gig_id=None, refresh=False):
+    """
+    Streams settlement rollup rows (one per gig and DJ connect account) in
+    gig_id order. Records arrive sorted by gig, so every gig on a page except
+    the last is complete once the page is summed; only one page and the gig
+    still in progress are held at a time. Closed gigs are served from the
+    on-disk cache when present and cached after their first full computation;
+    `refresh` recomputes them (e.g. after a late refund).
+    """
+    closed = closed_gig_ids()
+    totals = {}  # gig_id -> {dj_connect_id: sums} for gigs not yet emitted
+    cached = {}  # gig_id -> cached rows, for closed gigs whose records are skipped
+    in_progress = None
+
+    def finish(gig):
+        hit = cached.pop(gig, None)
+        if hit:
+            return hit
+        rows = _rows(gig, totals.pop(gig, {}))
+        if gig in closed and rows:
+            try:
+                cache_rollups(gig, rows)
+            except Exception as e:
+                logging.warning(f"Failed to cache settlement rollup for gig {gig}: {e}")
+        return rows
+
+    for page in iter_request_pages(gig_id):
+        order = []
+        for record in page:
+            if not order or order[-1] != _record_gig(record):
+                order.append(_record_gig(record))
+        for gig in order:
+            if gig != in_progress and gig in closed and not refresh:
+                cached[gig] = cached_rollups(gig)
+
+        live = [record for record in page if not cached.get(_record_gig(record))]
+        charged, intents = _charged_page(live) if live else ([], {})
+        if charged:
+            for (gig, account), sums in aggregate_page(charged, intents).items():
+                gig_totals = totals.setdefault(gig, {})
+                gig_totals[account] = gig_totals[account] + sums if account in gig_totals else sums
+
+        for gig in order[:-1]:
+            yield from finish(gig)
+        in_progress = order[-1]
+
+    if in_progress is not None:
+        yield from finish(in_progress)
+
+
+class AccountTotals:
+    """Running per-DJ-account totals built from the gig rollup rows as they stream past."""
+
+    def __init__(self):
+        self._sums = {}  # dj_connect_id -> int64 array of TOTAL_COLUMNS
+        self._gigs = {}  # dj_connect_id -> set of gig_ids
+
+    def add(self, row):
+        account = row['dj_connect_id']
+        sums = np.array([row[name] for name in TOTAL_COLUMNS], dtype=np.int64)
+        self._sums[account] = self._sums[account] + sums if account in self._sums else sums
+        self._gigs.setdefault(account, set()).add(row['gig_id'])
+
+    def rows(self):
+        return [dict(zip(ACCOUNT_COLUMNS, (account, len(self._gigs[account])) + tuple(int(v) for v in sums)))
+                for account, sums in sorted(self._sums.items())]
+
+    def grand_total(self):
+        total = sum(self._sums.values(), np.zeros(len(TOTAL_COLUMNS), dtype=np.int64))
+        return dict(zip(TOTAL_COLUMNS, (int(value) for value in total)))
+
+
+REPORT_COLUMNS = ('level', 'gig_id', 'dj_connect_id', 'gigs') + TOTAL_COLUMNS
+
+
+def _csv_line(values):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue()
+
+
+def iter_report_csv(rollups):
+    """
+    Renders rollup rows as CSV lines as they arrive: one 'gig' line per gig
+    and account, then one 'account' line per DJ account and a 'total' line.
+    """
+    accounts = AccountTotals()
+    yield _csv_line(REPORT_COLUMNS)
+    for row in rollups:
+        accounts.add(row)
+        yield _csv_line(dict(row, level='gig', gigs=1).get(name) for name in REPORT_COLUMNS)
+    for row in accounts.rows():
+        yield _csv_line(dict(row, level='account').get(name) for name in REPORT_COLUMNS)
+    yield _csv_line(dict(accounts.grand_total(), level='total').get(name) for name in REPORT_COLUMNS)
+
+
+def iter_report_json(rollups):
+    """Renders rollup rows as one JSON document, written out a row at a time."""
+    accounts = AccountTotals()
+    yield '{"gigs": ['
+    for i, row in enumerate(rollups):
+        accounts.add(row)
+        yield (',' if i else '') + json.dumps(row)
+    yield '], "accounts": ' + json.dumps(accounts.rows())
+    yield ', "totals": ' + json.dumps(accounts.grand_total()) + '}'
@@ -0,0 +1,88 @@
+import json
+import logging
+import os
+import threading
+
+import metrics
+
+CLICKSEND_API_KEY = os.getenv("CLICKSEND_API_KEY")
+CLICKSEND_USERNAME = os.getenv("CLICKSEND_USERNAME")
+CLICKSEND_API_HOST = os.getenv("CLICKSEND_API_HOST")  # override for local stand-ins
+
+# Messages per sms_send_post call (ClickSend accepts up to 1000)
+SMS_BATCH_SIZE = int(os.getenv("SMS_BATCH_SIZE", "100"))
+
+ACCEPTED_SMS_TEMPLATE = "Your song request for '{song}' has been accepted! Stick close to the dance floor it's playing soon!"
+
+
+class SmsDispatcher:
+    """
+    Sends song-accepted texts through one long-lived ClickSend client,
+    packing many messages into each SmsMessageCollection. Each message
+    carries its Airtable record id in `custom_string` so ClickSend's
+    per-message statuses can be mapped back to records.
+    """
+
+    def __init__(self, username=CLICKSEND_USERNAME, api_key=CLICKSEND_API_KEY, batch_size=SMS_BATCH_SIZE):
+        self.username = username
+        self.api_key = api_key
+        self.batch_size = batch_size
+        self._api = None
+        self._lock = threading.Lock()
+
+    @property
+    def api(self):
+        with self._lock:
+            if self._api is None:
+                # Imported here so worker boot doesn't pay for the SDK until the first text goes out
+                import clicksend_client
+                configuration = clicksend_client.Configuration()
+                configuration.username = self.username
+                configuration.password = self.api_key
+                if CLICKSEND_API_HOST:
+                    configuration.host = CLICKSEND_API_HOST
+                self._api = clicksend_client.SMSApi(clicksend_client.ApiClient(configuration))
+            return self._api
+
+    def send_batch(self, notifications):
+        """
+        Sends (record_id, phone_number, song_title) notifications and returns
+        the set of record ids whose message ClickSend accepted.
+        """
+        sent = set()
+        for i in range(0, len(notifications), self.batch_size):
+            chunk = notifications[i:i + self.batch_size]
+            api = self.api
+            from clicksend_client import SmsMessage, SmsMessageCollection
+            messages = [
+                SmsMessage(
+                    source="python",
+                    body=ACCEPTED_SMS_TEMPLATE.format(song=song_title),
+                    to=phone_number,
+                    custom_string=record_id
+                )
+                for record_id, phone_number, song_title in chunk
+            ]
+
+            try:
+                # Skip the SDK's deserializer, which turns the JSON body into a Python repr string
+                with metrics.track_call('clicksend', 'POST /sms/send'):
+                    response = api.sms_send_post(SmsMessageCollection(messages=messages), _preload_content=False)
+                body = json.loads(response.data)
+            except Exception as e:
+                # API, network or unreadable-body errors: none of the chunk can be counted as sent
+                logging.error(f"ClickSend SMS batch of {len(chunk)} failed: {e}")
+                continue
+
+            for result in (body.get('data') or {}).get('messages', []):
+                record_id = result.get('custom_string')
+                if result.get('status') == 'SUCCESS':
+                    sent.add(record_id)
+                else:
+                    logging.error(f"ClickSend rejected SMS for record {record_id}: {result.get('status')}")
+
+            logging.info(f"ClickSend batch sent {len(chunk)} message(s): {body.get('response_code')}")
+        return sent
+
+
+sms_dispatcher = SmsDispatcher()
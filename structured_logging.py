@@ -0,0 +1,169 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import sys
+import threading
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# 'json' for one JSON object per line, 'text' for the old human-readable format
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+# Success-path records tagged with extra=SAMPLED: keep 1 in LOG_SAMPLE_EVERY per call site
+LOG_SAMPLE_EVERY = max(1, int(os.getenv("LOG_SAMPLE_EVERY", "10")))
+# Records buffered for the writer thread; past this, new records are dropped instead of blocking requests
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# Libraries that log every HTTP request or job run at INFO
+QUIET_LOGGERS = ('stripe', 'apscheduler.executors.default')
+
+# Pass as `extra=SAMPLED` on noisy, routine success logs
+SAMPLED = {'sampled': True}
+
+# Attributes every LogRecord has; anything else came in through `extra` and is emitted as a field
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'sampled'}
+
+_REDACTIONS = [
+    # Stripe client secrets (SetupIntent / PaymentIntent) and API keys
+    (re.compile(r'\b(?:seti|pi)_[A-Za-z0-9]+_secret_[A-Za-z0-9]+'), '[REDACTED_CLIENT_SECRET]'),
+    (re.compile(r'\b(?:sk|rk)_(?:live|test)_[A-Za-z0-9]+'), '[REDACTED_API_KEY]'),
+    (re.compile(r'(?i)(bearer\s+)[^\s\'",}]+'), r'\1[REDACTED]'),
+    (re.compile(r'(?i)([\'"]?(?:client_secret|authorization|password|api_key)[\'"]?\s*[:=]\s*[\'"]?)[^\'",}\s]+'),
+     r'\1[REDACTED]'),
+    # PII: keep the email domain and the last two phone digits for debugging
+    (re.compile(r'\b[A-Za-z0-9._%+-]+@([A-Za-z0-9.-]+\.[A-Za-z]{2,})\b'), r'***@\1'),
+    # Phones only where they look like phones (a phone key, a leading +, or grouped digits), so bare
+    # timestamps, ids and amounts pass through intact
+    (re.compile(r'(?i)([\'"]?phone(?:_number)?[\'"]?\s*[:=]\s*[\'"]?)\+?[\d\s().-]{6,}?(\d{2})(?=[\'",}\s]|$)'),
+     r'\1***\2'),
+    (re.compile(r'(?<![\w.+])\+\d{1,2}[\s.-]?\(?\d{3}\)?[\s.-]?\d{3}[\s.-]?\d{2}(\d{2})(?![\w.])'), r'***\1'),
+    (re.compile(r'(?<![\w.])(?:1[\s.-])?(?:\(\d{3}\)\s?|\d{3}[\s.-])\d{3}[\s.-]\d{2}(\d{2})(?![\w.])'), r'***\1'),
+]
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def redact(text):
+    """Masks Stripe secrets, bearer tokens, emails and phone numbers in `text`."""
+    for pattern, replacement in _REDACTIONS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def _redact_value(value):
+    if isinstance(value, str):
+        return redact(value)
+    if isinstance(value, (int, float, bool)) or value is None:
+        return value
+    return redact(str(value))
+
+
+def _redact_phone(value):
+    digits = re.sub(r'\D', '', str(value or ''))
+    return f'***{digits[-2:]}' if digits else value
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; the message, traceback and extra fields are redacted."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': redact(record.getMessage()),
+            'thread': record.threadName,
+            'where': f'{record.module}:{record.lineno}',
+        }
+        for name, value in vars(record).items():
+            if name not in _STANDARD_ATTRS and name not in entry:
+                entry[name] = _redact_phone(value) if 'phone' in name else _redact_value(value)
+        if record.exc_info:
+            entry['exc'] = redact(self.formatException(record.exc_info))
+        elif record.exc_text:
+            entry['exc'] = redact(record.exc_text)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class RedactingTextFormatter(logging.Formatter):
+    def format(self, record):
+        return redact(super().format(record))
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps every record except SAMPLED ones, which pass 1 in `every` per call site."""
+
+    def __init__(self, every=LOG_SAMPLE_EVERY):
+        super().__init__()
+        self.every = every
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if not getattr(record, 'sampled', False) or record.levelno > logging.INFO:
+            return True
+        site = (record.pathname, record.lineno)
+        with self._lock:
+            count = self._counts.get(site, 0)
+            self._counts[site] = count + 1
+        if count % self.every:
+            return False
+        record.sample_rate = self.every
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Enqueues records without formatting them; the listener thread does the
+    message interpolation, redaction and JSON serialization. When the queue is
+    full the record is dropped rather than stalling the request.
+    """
+
+    def prepare(self, record):
+        if record.exc_info:
+            # Render the traceback now, while the frames still describe the failure
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+def configure_logging(level=LOG_LEVEL, stream=None):
+    """
+    Routes the root logger through a bounded queue to a background writer
+    thread. Safe to call more than once; later calls are no-ops.
+    """
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            return
+
+        writer = logging.StreamHandler(stream or sys.stdout)
+        if LOG_FORMAT == 'json':
+            writer.setFormatter(JsonFormatter())
+        else:
+            writer.setFormatter(RedactingTextFormatter('%(asctime)s - %(levelname)s - %(message)s'))
+
+        handler = NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+        handler.addFilter(SamplingFilter())
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(level)
+        for name in QUIET_LOGGERS:
+            logging.getLogger(name).setLevel(max(logging.WARNING, root.level))
+
+        _listener = logging.handlers.QueueListener(handler.queue, writer, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
@@ -0,0 +1,158 @@
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+
+import local_db
+from airtable_batch import batch_writer
+from airtable_client import AIRTABLE_BACKOFF_CAP, AIRTABLE_MAX_RETRIES, AIRTABLE_TIMEOUT
+
+# Pending Airtable creates that the API already acknowledged; flushed in the background with retry
+WRITE_BEHIND_POLL_SECONDS = float(os.getenv("WRITE_BEHIND_POLL_SECONDS", "1"))
+WRITE_BEHIND_COALESCE_SECONDS = float(os.getenv("WRITE_BEHIND_COALESCE_MS", "100")) / 1000
+WRITE_BEHIND_MAX_ATTEMPTS = int(os.getenv("WRITE_BEHIND_MAX_ATTEMPTS", "8"))
+WRITE_BEHIND_RETRY_BASE_SECONDS = float(os.getenv("WRITE_BEHIND_RETRY_BASE_SECONDS", "5"))
+WRITE_BEHIND_RETRY_CAP_SECONDS = 600
+# A claimed row whose worker died is handed out again after this long: twice the longest the Airtable
+# client can spend on one call with all its retries, so a slow but live flush is never claimed twice
+WRITE_BEHIND_LEASE_SECONDS = 2 * ((AIRTABLE_MAX_RETRIES + 1) * AIRTABLE_TIMEOUT
+                                  + AIRTABLE_MAX_RETRIES * AIRTABLE_BACKOFF_CAP)
+WRITE_BEHIND_CLAIM_SIZE = 50
+# Queued creates are sent as upserts on these fields, so a retry after a timeout or 5xx that Airtable
+# had in fact applied updates that record instead of adding a duplicate
+WRITE_BEHIND_MERGE_FIELDS = {
+    'song_requests_tbl': ('request_id',),
+    'customers_tbl': ('stripe_id',),
+}
+
+_wakeup = threading.Event()
+_flusher = None
+_flusher_lock = threading.Lock()
+
+
+def _schema(conn):
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS pending_creates ("
+        " id INTEGER PRIMARY KEY AUTOINCREMENT, table_name TEXT NOT NULL, fields TEXT NOT NULL,"
+        " attempts INTEGER NOT NULL DEFAULT 0, next_attempt_at REAL NOT NULL, claimed_at REAL,"
+        " last_error TEXT, dead INTEGER NOT NULL DEFAULT 0)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS pending_creates_due ON pending_creates (dead, next_attempt_at)")
+
+
+_db = local_db.LocalDB("write_behind", _schema)
+
+
+def enqueue_create(table, fields):
+    """
+    Durably queues an Airtable record create and returns its local queue id.
+    The background flusher sends it in 10-record batches with retry, as an
+    upsert on the table's WRITE_BEHIND_MERGE_FIELDS.
+    """
+    merge_on = WRITE_BEHIND_MERGE_FIELDS.get(table)
+    if not merge_on or not all(fields.get(name) for name in merge_on):
+        raise ValueError(f"Write-behind creates on {table} need {merge_on or 'merge fields'} to retry safely.")
+    with _db as conn:
+        cursor = conn.execute(
+            "INSERT INTO pending_creates (table_name, fields, next_attempt_at) VALUES (?, ?, ?)",
+            (table, json.dumps(fields), time.time())
+        )
+        queue_id = cursor.lastrowid
+    start_flusher()
+    _wakeup.set()
+    return queue_id
+
+
+def enqueue_update(table, fields):
+    """
+    Durably queues an update to the record whose WRITE_BEHIND_MERGE_FIELDS
+    match `fields`. It goes out as the same upsert as a create, so it lands
+    whether or not that record's own queued create has been flushed yet.
+    """
+    return enqueue_create(table, fields)
+
+
+def _claim_due():
+    now = time.time()
+    with _db as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT id, table_name, fields, attempts FROM pending_creates"
+                " WHERE dead = 0 AND next_attempt_at <= ? AND (claimed_at IS NULL OR claimed_at < ?)"
+                " ORDER BY id LIMIT ?",
+                (now, now - WRITE_BEHIND_LEASE_SECONDS, WRITE_BEHIND_CLAIM_SIZE)
+            ).fetchall()
+            conn.executemany("UPDATE pending_creates SET claimed_at = ? WHERE id = ?", [(now, row[0]) for row in rows])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    return rows
+
+
+def _finish(queue_id):
+    with _db as conn:
+        conn.execute("DELETE FROM pending_creates WHERE id = ?", (queue_id,))
+
+
+def _retry_later(queue_id, attempts, error):
+    attempts += 1
+    status = error.response.status_code if isinstance(error, requests.HTTPError) and error.response is not None else None
+    # Airtable rejected the record itself (bad field, schema); resending the same payload can't succeed
+    rejected = status is not None and 400 <= status < 500 and status != 429
+    dead = rejected or attempts >= WRITE_BEHIND_MAX_ATTEMPTS
+    delay = min(WRITE_BEHIND_RETRY_CAP_SECONDS, WRITE_BEHIND_RETRY_BASE_SECONDS * (2 ** (attempts - 1)))
+    with _db as conn:
+        conn.execute(
+            "UPDATE pending_creates SET attempts = ?, next_attempt_at = ?, claimed_at = NULL, last_error = ?, dead = ?"
+            " WHERE id = ?",
+            (attempts, time.time() + delay, str(error)[:500], int(dead), queue_id)
+        )
+    if dead:
+        logging.error(f"Write-behind create {queue_id} gave up after {attempts} attempts: {error}")
+    else:
+        logging.warning(f"Write-behind create {queue_id} failed (attempt {attempts}), retrying in {delay:.0f}s: {error}")
+
+
+def flush_once():
+    """Sends every due queued create; returns how many were written to Airtable."""
+    rows = _claim_due()
+    pending = [(queue_id, attempts, batch_writer.upsert(table, json.loads(fields), WRITE_BEHIND_MERGE_FIELDS[table]))
+               for queue_id, table, fields, attempts in rows]
+    if pending:
+        batch_writer.flush()
+
+    written = 0
+    for queue_id, attempts, future in pending:
+        try:
+            future.result()
+            _finish(queue_id)
+            written += 1
+        except Exception as e:
+            _retry_later(queue_id, attempts, e)
+    return written
+
+
+def _run():
+    while True:
+        if _wakeup.wait(timeout=WRITE_BEHIND_POLL_SECONDS):
+            # Let a burst of enqueues land so they share full 10-record batches
+            time.sleep(WRITE_BEHIND_COALESCE_SECONDS)
+        _wakeup.clear()
+        try:
+            while flush_once() == WRITE_BEHIND_CLAIM_SIZE:
+                pass
+        except Exception as e:
+            logging.error(f"Write-behind flusher error: {e}")
+
+
+def start_flusher():
+    global _flusher
+    with _flusher_lock:
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = threading.Thread(target=_run, name="write-behind-flusher", daemon=True)
+            _flusher.start()